@@ -1,7 +1,6 @@
-import os.path
-
 from robotics.joystick import *
 from robotics.kinematics.leg import *
+from robotics.kinematics.multipod import *
 
 scene.range = 5
 scene.forward = [1, 0, 0]
@@ -10,44 +9,42 @@ arrow(axis = [1, 0, 0], color = color.red)
 arrow(axis = [0, 1, 0], color = color.green)
 arrow(axis = [0, 0, 1], color = color.blue)
 
-lookup_table = LookupTable(
+lookup_table = LazyLookupTable(
         input_specifications = [
             {'from': -2, 'to': 2, 'points': 9},
             {'from': -2, 'to': 2, 'points': 9},
             {'from': -2, 'to': 2, 'points': 9}],
-        output_size = 3)
-
-if os.path.isfile('lookup_leg.npy'):
-    lookup_table.load('lookup_leg.npy')
-else:
-    LookupTableLeg.populate(lookup_table)
-    lookup_table.save('lookup_leg')
+        output_size = 3,
+        filename = 'lookup_leg',
+        fingerprint = LookupTableLeg.fingerprint())
+LookupTableLeg.populate(lookup_table)
 
 legs_count = 6
 
 joystick = Joystick("/dev/input/js1")
-
-legs = []
-leg_translation = Displacement(translation = (1, 0, 0))
-for i in xrange(legs_count):
-    angle = i * tau / legs_count
-    leg_rotation = Displacement(rotation = Rotation.axis_angle((0, 0, 1), angle))
-    leg_displacement = leg_rotation.compose(leg_translation)
-    leg = LookupTableLeg(
-            initial_displacement = leg_displacement,
-            lookup_table = lookup_table)
-    leg.initialize_draw()
-    legs.append(leg)
+joystick.start()
+
+legs_rotations = RotationArray.axis_angle(
+        (0, 0, 1), np.arange(legs_count) * tau / legs_count)
+legs_displacements = DisplacementArray(rotations = legs_rotations).compose(
+        Displacement(translation = (1, 0, 0)))
+multipod = Multipod(
+        mount_displacements = legs_displacements,
+        lookup_table = lookup_table,
+        cache_directory = 'generated')
+multipod.initialize_draw()
 
 t = 0.0
 dt = 0.04
-while True:
-    rate(25)
-    t += dt
-    joystick.update()
-    x = -2 * joystick.axis_states["ry"]
-    y = 2 * joystick.axis_states["rx"]
-    z = 2 * (joystick.axis_states["y"])
-    for i in xrange(legs_count):
-        legs[i].endpoint_inverse_kinematics((x, y, z))
-        legs[i].draw()
+try:
+    while True:
+        rate(25)
+        t += dt
+        axis_states = joystick.snapshot().axis_states
+        x = -2 * axis_states["ry"]
+        y = 2 * axis_states["rx"]
+        z = 2 * (axis_states["y"])
+        multipod.endpoints_inverse_kinematics((x, y, z))
+        multipod.draw()
+finally:
+    lookup_table.flush()
@@ -6,6 +6,9 @@ from robotics.jacobian import *
 
 class ExampleTree:
 
+    joints = ('root_a_joint', 'a_b_joint', 'b_c1_joint', 'c1_d1_joint',
+            'b_c2_joint', 'c2_d2_joint')
+
     def __init__(self):
         """Constructor"""
         self._initialize_tree()
@@ -15,17 +18,16 @@ class ExampleTree:
         self._target_endpoint = self._endpoint
         self._solver = DampedLeastSquaresSolver(
                 function = lambda x: self.endpoint(x),
+                jacobian = self._endpoint_jacobian,
+                dependency_mask = self._compiled_tree.dependency_mask(
+                    ['d1', 'd2']),
                 constant = 0.8,
                 max_input_fix = tau / 16,
                 max_output_error = 1)
 
     def endpoint(self, joints_angles):
         """Forward kinematics equation of the tree endpoint"""
-        parameters = self._prepare_parameters(joints_angles)
-        displacements = self._tree.evaluate(parameters)
-        return np.concatenate([
-                displacements['d1'].translation,
-                displacements['d2'].translation])
+        return self._endpoint_function(joints_angles)
 
     def endpoint_inverse_kinematics(self, target_endpoint):
         """Update the joints angles according to an IK approximation
@@ -123,16 +125,16 @@ class ExampleTree:
                 key = 'd2',
                 part = RigidLink(1),
                 parent = 'c2_d2_joint')
+        self._compiled_tree = self._tree.compile(
+                joints = ExampleTree.joints, incremental = True)
+        self._endpoint_function, self._endpoint_jacobian = \
+                self._compiled_tree.generate(['d1', 'd2'], jacobian = True)
 
     def _prepare_parameters(self, joints_angles):
         """Prepare tree parameters from joints angles"""
         parameters = self._tree.prepare_parameters()
-        parameters['root_a_joint']['angle'] = joints_angles[0]
-        parameters['a_b_joint']['angle'] = joints_angles[1]
-        parameters['b_c1_joint']['angle'] = joints_angles[2]
-        parameters['c1_d1_joint']['angle'] = joints_angles[3]
-        parameters['b_c2_joint']['angle'] = joints_angles[4]
-        parameters['c2_d2_joint']['angle'] = joints_angles[5]
+        for key, angle in zip(ExampleTree.joints, joints_angles):
+            parameters[key]['angle'] = angle
         return parameters
 
 scene.range = 5
@@ -140,6 +142,7 @@ scene.forward = [0, 0, 1]
 scene.up = [0, 1, 0]
 
 joystick = Joystick("/dev/input/js1")
+joystick.start()
 
 tree = ExampleTree()
 tree.initialize_draw()
@@ -149,10 +152,10 @@ dt = 0.04
 while True:
     rate(25)
     t += dt
-    joystick.update()
-    x1 = -4 *joystick.axis_states["x"]
-    y1 = -4 * joystick.axis_states["y"]
-    x2 = -4 *joystick.axis_states["rx"]
-    y2 = -4 * joystick.axis_states["ry"]
+    axis_states = joystick.snapshot().axis_states
+    x1 = -4 *axis_states["x"]
+    y1 = -4 * axis_states["y"]
+    x2 = -4 *axis_states["rx"]
+    y2 = -4 * axis_states["ry"]
     tree.endpoint_inverse_kinematics([x1, y1, 0, x2, y2, 0])
     tree.draw()
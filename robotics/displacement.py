@@ -2,13 +2,22 @@ import numpy as np
 
 tau = 6.28318530718
 
-class Rotation:
+class Rotation(object):
     """This implementation uses 3x3 matrices"""
 
+    __slots__ = ('_matrix',)
+
     def __init__(self):
         """Identity constructor"""
         self._matrix = np.identity(3, np.float_)
 
+    @staticmethod
+    def _from_matrix(matrix):
+        """Creates a rotation wrapping a matrix, without copying it"""
+        rotation = Rotation.__new__(Rotation)
+        rotation._matrix = matrix
+        return rotation
+
     @staticmethod
     def axis_angle(axis, angle):
         """Creates a rotation from an axis and an angle"""
@@ -26,67 +35,587 @@ class Rotation:
         ab = a * b
         bd = b * d
         cd = c * d
-        rotation = Rotation()
-        rotation._matrix = np.array((
+        return Rotation._from_matrix(np.array((
                 (aa + bb - cc - dd, 2 * (bc + ad), 2 * (bd - ac)),
                 (2 * (bc - ad), aa + cc - bb - dd, 2 * (cd + ab)),
                 (2 * (bd + ac), 2 * (cd - ab), aa + dd - bb - cc)),
-                np.float_)
-        return rotation
+                np.float_))
 
     def copy(self):
         """Clones a rotation"""
-        rotation = Rotation()
-        rotation._matrix = self._matrix.copy()
-        return rotation
+        return Rotation._from_matrix(self._matrix.copy())
 
     def rotate(self, vector):
         """Rotates a vector"""
-        vector = np.asfarray(vector)
         return np.dot(self._matrix, vector)
 
+    def rotate_into(self, vector, out):
+        """Rotates a vector into an existing float array"""
+        if np.may_share_memory(vector, out):
+            out[...] = np.dot(self._matrix, vector)
+        else:
+            np.dot(self._matrix, vector, out)
+
     def compose(self, other):
-        """Equivalent rotation to self then other"""
-        rotation = Rotation()
-        rotation._matrix = np.dot(self._matrix, other._matrix)
-        return rotation
+        """Equivalent rotation to self then other. The other rotation
+        may also be a quaternion.
+        """
+        if isinstance(other, Quaternion): other = other.to_rotation()
+        return Rotation._from_matrix(np.dot(self._matrix, other._matrix))
+
+    def compose_into(self, other, out):
+        """Writes the equivalent rotation to self then other into an
+        existing rotation. Does not allocate unless out is an operand or
+        the other rotation is a quaternion.
+        """
+        if isinstance(other, Quaternion): other = other.to_rotation()
+        if out is self or out is other:
+            out._matrix[...] = np.dot(self._matrix, other._matrix)
+        else:
+            np.dot(self._matrix, other._matrix, out._matrix)
 
     def inverse(self):
         """Returns the inverse rotation (same axis, opposite angle)"""
-        rotation = Rotation()
-        rotation._matrix = np.transpose(self._matrix)
-        return rotation
+        return Rotation._from_matrix(np.transpose(self._matrix).copy())
+
+    def inverse_into(self, out):
+        """Writes the inverse rotation into an existing rotation"""
+        if out is self: self._matrix[...] = self._matrix.T.copy()
+        else: out._matrix[...] = self._matrix.T
 
-class Displacement:
+class Displacement(object):
     """Combination of a translation and a rotation representing a rigid
     body displacement in space. The translation is applied *before* the
     rotation.
     """
 
-    def __init__(self, translation = None, rotation = None):
-        """Constructor"""
-        if translation != None: self.translation = np.array(translation)
-        else: self.translation = np.asarray((0, 0, 0), np.float_)
-        if rotation != None: self.rotation = rotation.copy()
-        else: self.rotation = Rotation()
+    __slots__ = ('translation', 'rotation')
+
+    def __init__(self, translation = None, rotation = None, copy = True):
+        """Constructor. Trusted callers may pass copy = False to take
+        ownership of a float translation array and a rotation instead of
+        copying them.
+        """
+        if translation is None:
+            self.translation = np.zeros(3, np.float_)
+        elif copy: self.translation = np.array(translation, np.float_)
+        else: self.translation = translation
+        if rotation is None: self.rotation = Rotation()
+        elif copy: self.rotation = rotation.copy()
+        else: self.rotation = rotation
 
     def copy(self):
         """Clones a displacement"""
-        displacement = Displacement(
-                translation = self.translation.copy(),
-                rotation = self.rotation.copy())
-        return displacement
+        return Displacement(self.translation.copy(), self.rotation.copy(),
+                copy = False)
 
     def compose(self, other):
         """Equivalent displacement to self then other"""
-        displacement = Displacement(
-            self.translation + self.rotation.rotate(other.translation),
-            self.rotation.compose(other.rotation))
-        return displacement
+        return Displacement(
+                self.translation + self.rotation.rotate(other.translation),
+                self.rotation.compose(other.rotation),
+                copy = False)
+
+    def compose_into(self, other, out):
+        """Writes the equivalent displacement to self then other into an
+        existing displacement. Does not allocate unless out is an
+        operand.
+        """
+        if out is self or out is other:
+            out.translation[...] = \
+                    self.translation + self.rotation.rotate(other.translation)
+        else:
+            self.rotation.rotate_into(other.translation, out.translation)
+            out.translation += self.translation
+        self.rotation.compose_into(other.rotation, out.rotation)
 
     def inverse(self):
         """Returns the inverse displacement"""
         inverse_rotation = self.rotation.inverse()
-        displacement = Displacement(
-            inverse_rotation.rotate(-self.translation), inverse_rotation)
-        return displacement
+        return Displacement(inverse_rotation.rotate(-self.translation),
+                inverse_rotation, copy = False)
+
+    def inverse_into(self, out):
+        """Writes the inverse displacement into an existing displacement"""
+        self.rotation.inverse_into(out.rotation)
+        out.rotation.rotate_into(self.translation, out.translation)
+        np.negative(out.translation, out.translation)
+
+_identity = np.identity(3, np.float_)
+
+class RotationArray:
+    """Batch of rotations. This implementation uses a (N, 3, 3) array
+    of matrices so that whole batches are processed by broadcasting.
+    """
+
+    def __init__(self, size = 1):
+        """Identity constructor"""
+        self._matrices = np.tile(np.identity(3, np.float_), (size, 1, 1))
+
+    @staticmethod
+    def axis_angle(axes, angles):
+        """Creates rotations from axes and angles. A single axis or a
+        single angle is shared by the whole batch.
+        """
+        axes = np.asfarray(axes)
+        angles = np.asfarray(angles)
+        normalized_axes = axes / np.sqrt(
+                np.sum(axes * axes, axis = -1))[..., np.newaxis]
+        cross_matrices, outer_matrices = \
+                RotationArray._axes_matrices(normalized_axes)
+        rotations = RotationArray(0)
+        rotations._matrices = RotationArray._rodrigues(
+                cross_matrices, outer_matrices, angles).reshape(-1, 3, 3)
+        return rotations
+
+    @staticmethod
+    def from_rotations(rotations):
+        """Packs a sequence of rotations into a batch"""
+        rotation_array = RotationArray(0)
+        rotation_array._matrices = np.array(
+                [rotation._matrix for rotation in rotations], np.float_)
+        return rotation_array
+
+    def __len__(self):
+        """Number of rotations in the batch"""
+        return len(self._matrices)
+
+    def __getitem__(self, index):
+        """Extracts a single rotation from the batch"""
+        return Rotation._from_matrix(self._matrices[index].copy())
+
+    def copy(self):
+        """Clones a batch of rotations"""
+        rotations = RotationArray(0)
+        rotations._matrices = self._matrices.copy()
+        return rotations
+
+    def rotate(self, vectors):
+        """Rotates a (N, 3) array of vectors, or a single vector by
+        every rotation of the batch.
+        """
+        vectors = np.asfarray(vectors)
+        return np.matmul(self._matrices, vectors[..., np.newaxis])[..., 0]
+
+    def compose(self, other):
+        """Equivalent rotations to self then other. The other operand
+        may be a single rotation shared by the whole batch, and may also
+        be quaternions.
+        """
+        rotations = RotationArray(0)
+        rotations._matrices = np.matmul(
+                self._matrices, RotationArray._as_matrices(other))
+        return rotations
+
+    def inverse(self):
+        """Returns the inverse rotations (same axes, opposite angles)"""
+        rotations = RotationArray(0)
+        rotations._matrices = np.transpose(self._matrices, (0, 2, 1))
+        return rotations
+
+    @staticmethod
+    def _axes_matrices(normalized_axes):
+        """Cross product and outer product matrices of normalized axes,
+        which only depend on the axes in the Rodrigues formula.
+        """
+        x = normalized_axes[..., 0]
+        y = normalized_axes[..., 1]
+        z = normalized_axes[..., 2]
+        cross_matrices = np.zeros(normalized_axes.shape + (3,), np.float_)
+        cross_matrices[..., 0, 1] = -z
+        cross_matrices[..., 0, 2] = y
+        cross_matrices[..., 1, 0] = z
+        cross_matrices[..., 1, 2] = -x
+        cross_matrices[..., 2, 0] = -y
+        cross_matrices[..., 2, 1] = x
+        outer_matrices = normalized_axes[..., :, np.newaxis] * \
+                normalized_axes[..., np.newaxis, :]
+        return cross_matrices, outer_matrices
+
+    @staticmethod
+    def _rodrigues(cross_matrices, outer_matrices, angles):
+        """Rotation matrices from the axes matrices and the angles"""
+        cosines = np.cos(angles)[..., np.newaxis, np.newaxis]
+        sines = np.sin(angles)[..., np.newaxis, np.newaxis]
+        return cosines * _identity + sines * cross_matrices + \
+                (1 - cosines) * outer_matrices
+
+    @staticmethod
+    def _as_matrices(rotations):
+        """Matrices of a batch of rotations or of a single rotation,
+        either of which may be quaternions.
+        """
+        if isinstance(rotations, RotationArray): return rotations._matrices
+        if isinstance(rotations, Rotation): return rotations._matrix
+        return _quaternions_matrices(
+                QuaternionArray._as_quaternions(rotations))
+
+class DisplacementArray:
+    """Batch of rigid body displacements stored as a (N, 3) array of
+    translations and a rotation array. As for a single displacement the
+    translation is applied *before* the rotation.
+    """
+
+    def __init__(self, translations = None, rotations = None):
+        """Constructor. Defaults to a single identity displacement, or
+        to as many identity translations or rotations as required to
+        match the other argument.
+        """
+        if translations is not None:
+            self.translations = np.array(translations, np.float_, ndmin = 2)
+        if rotations is not None: self.rotations = rotations.copy()
+        else:
+            size = 1 if translations is None else len(self.translations)
+            self.rotations = RotationArray(size)
+        if translations is None:
+            self.translations = np.zeros((len(self.rotations), 3), np.float_)
+
+    @staticmethod
+    def from_displacements(displacements):
+        """Packs a sequence of displacements into a batch"""
+        return DisplacementArray(
+                translations = [d.translation for d in displacements],
+                rotations = RotationArray.from_rotations(
+                    [d.rotation for d in displacements]))
+
+    def __len__(self):
+        """Number of displacements in the batch"""
+        return len(self.translations)
+
+    def __getitem__(self, index):
+        """Extracts a single displacement from the batch"""
+        return Displacement(
+                translation = self.translations[index].copy(),
+                rotation = self.rotations[index],
+                copy = False)
+
+    def copy(self):
+        """Clones a batch of displacements"""
+        return DisplacementArray(
+                translations = self.translations.copy(),
+                rotations = self.rotations.copy())
+
+    def compose(self, other):
+        """Equivalent displacements to self then other. The other
+        operand may be a single displacement shared by the whole batch.
+        """
+        if isinstance(other, DisplacementArray):
+            other_translations = other.translations
+            other_rotations = other.rotations
+        else:
+            other_translations = other.translation
+            other_rotations = other.rotation
+        displacements = DisplacementArray(
+            self.translations + self.rotations.rotate(other_translations),
+            self.rotations.compose(other_rotations))
+        return displacements
+
+    def inverse(self):
+        """Returns the inverse displacements"""
+        inverse_rotations = self.rotations.inverse()
+        displacements = DisplacementArray(
+            inverse_rotations.rotate(-self.translations), inverse_rotations)
+        return displacements
+
+class Quaternion(object):
+    """Rotation implemented with a unit quaternion (w, x, y, z). It has
+    the same interface as Rotation, composition costs a quaternion
+    product, and renormalization removes the drift of repeated
+    compositions.
+    """
+
+    __slots__ = ('_quaternion',)
+
+    def __init__(self):
+        """Identity constructor"""
+        self._quaternion = np.array((1, 0, 0, 0), np.float_)
+
+    @staticmethod
+    def axis_angle(axis, angle):
+        """Creates a rotation from an axis and an angle"""
+        axis = np.asfarray(axis)
+        quaternion = Quaternion()
+        quaternion._quaternion[0] = np.cos(angle / 2.0)
+        quaternion._quaternion[1:] = \
+                axis * (np.sin(angle / 2.0) / np.linalg.norm(axis))
+        return quaternion
+
+    @staticmethod
+    def from_rotation(rotation):
+        """Creates a quaternion from a matrix rotation"""
+        quaternion = Quaternion()
+        quaternion._quaternion = _matrices_quaternions(rotation._matrix)
+        return quaternion
+
+    def to_rotation(self):
+        """Converts to a matrix rotation"""
+        rotation = Rotation()
+        rotation._matrix = _quaternions_matrices(self._quaternion)
+        return rotation
+
+    def copy(self):
+        """Clones a rotation"""
+        quaternion = Quaternion()
+        quaternion._quaternion = self._quaternion.copy()
+        return quaternion
+
+    def rotate(self, vector):
+        """Rotates a vector"""
+        return np.array(self._rotated(vector))
+
+    def rotate_into(self, vector, out):
+        """Rotates a vector into an existing float array"""
+        out[:] = self._rotated(vector)
+
+    def _rotated(self, vector):
+        """Components of a rotated vector"""
+        w, x, y, z = self._quaternion.tolist()
+        vx, vy, vz = vector[0], vector[1], vector[2]
+        # v + w t + u x t, where t = 2 u x v
+        tx = 2 * (y * vz - z * vy)
+        ty = 2 * (z * vx - x * vz)
+        tz = 2 * (x * vy - y * vx)
+        return (vx + w * tx + y * tz - z * ty,
+                vy + w * ty + z * tx - x * tz,
+                vz + w * tz + x * ty - y * tx)
+
+    def compose(self, other):
+        """Equivalent rotation to self then other. The other rotation
+        may also be a matrix rotation.
+        """
+        if isinstance(other, Rotation):
+            other = Quaternion.from_rotation(other)
+        quaternion = Quaternion.__new__(Quaternion)
+        quaternion._quaternion = np.array(self._product(other))
+        return quaternion
+
+    def compose_into(self, other, out):
+        """Writes the equivalent rotation to self then other into an
+        existing quaternion. The other rotation may also be a matrix
+        rotation.
+        """
+        if isinstance(other, Rotation):
+            other = Quaternion.from_rotation(other)
+        out._quaternion[:] = self._product(other)
+
+    def _product(self, other):
+        """Components of the Hamilton product of self and other"""
+        w1, x1, y1, z1 = self._quaternion.tolist()
+        w2, x2, y2, z2 = other._quaternion.tolist()
+        return (w1 * w2 - x1 * x2 - y1 * y2 - z1 * z2,
+                w1 * x2 + x1 * w2 + y1 * z2 - z1 * y2,
+                w1 * y2 - x1 * z2 + y1 * w2 + z1 * x2,
+                w1 * z2 + x1 * y2 - y1 * x2 + z1 * w2)
+
+    def inverse(self):
+        """Returns the inverse rotation (same axis, opposite angle)"""
+        quaternion = Quaternion.__new__(Quaternion)
+        quaternion._quaternion = self._quaternion * (1, -1, -1, -1)
+        return quaternion
+
+    def inverse_into(self, out):
+        """Writes the inverse rotation into an existing quaternion"""
+        out._quaternion[0] = self._quaternion[0]
+        np.negative(self._quaternion[1:], out._quaternion[1:])
+
+    def normalize(self):
+        """Renormalizes the quaternion in place"""
+        self._quaternion /= np.linalg.norm(self._quaternion)
+
+    def slerp(self, other, t):
+        """Spherical linear interpolation from self (t = 0) to other
+        (t = 1) along the shortest arc.
+        """
+        quaternion = Quaternion()
+        quaternion._quaternion = _slerp(
+                self._quaternion, other._quaternion, np.asfarray(t))
+        return quaternion
+
+class QuaternionArray:
+    """Batch of rotations implemented with a (N, 4) array of unit
+    quaternions. It has the same interface as RotationArray.
+    """
+
+    def __init__(self, size = 1):
+        """Identity constructor"""
+        self._quaternions = np.zeros((size, 4), np.float_)
+        self._quaternions[:, 0] = 1
+
+    @staticmethod
+    def axis_angle(axes, angles):
+        """Creates rotations from axes and angles. A single axis or a
+        single angle is shared by the whole batch.
+        """
+        axes = np.asfarray(axes)
+        half_angles = np.asfarray(angles)[..., np.newaxis] / 2.0
+        normalized_axes = axes / np.sqrt(
+                np.sum(axes * axes, axis = -1))[..., np.newaxis]
+        vectors = np.sin(half_angles) * normalized_axes
+        scalars = np.cos(half_angles) * np.ones(vectors.shape[:-1] + (1,))
+        quaternions = QuaternionArray(0)
+        quaternions._quaternions = np.concatenate(
+                (scalars, vectors), axis = -1).reshape(-1, 4)
+        return quaternions
+
+    @staticmethod
+    def from_quaternions(quaternions):
+        """Packs a sequence of quaternions into a batch"""
+        quaternion_array = QuaternionArray(0)
+        quaternion_array._quaternions = np.array(
+                [quaternion._quaternion for quaternion in quaternions],
+                np.float_)
+        return quaternion_array
+
+    @staticmethod
+    def from_rotation_array(rotations):
+        """Creates quaternions from a batch of matrix rotations"""
+        quaternions = QuaternionArray(0)
+        quaternions._quaternions = _matrices_quaternions(rotations._matrices)
+        return quaternions
+
+    def to_rotation_array(self):
+        """Converts to a batch of matrix rotations"""
+        rotations = RotationArray(0)
+        rotations._matrices = _quaternions_matrices(self._quaternions)
+        return rotations
+
+    def __len__(self):
+        """Number of rotations in the batch"""
+        return len(self._quaternions)
+
+    def __getitem__(self, index):
+        """Extracts a single rotation from the batch"""
+        quaternion = Quaternion()
+        quaternion._quaternion = self._quaternions[index].copy()
+        return quaternion
+
+    def copy(self):
+        """Clones a batch of rotations"""
+        quaternions = QuaternionArray(0)
+        quaternions._quaternions = self._quaternions.copy()
+        return quaternions
+
+    def rotate(self, vectors):
+        """Rotates a (N, 3) array of vectors, or a single vector by
+        every rotation of the batch.
+        """
+        vectors = np.asfarray(vectors)
+        w = self._quaternions[:, :1]
+        u = self._quaternions[:, 1:]
+        t = 2 * np.cross(u, vectors)
+        return vectors + w * t + np.cross(u, t)
+
+    def compose(self, other):
+        """Equivalent rotations to self then other. The other operand
+        may be a single quaternion shared by the whole batch, and may also
+        be matrix rotations.
+        """
+        quaternions = QuaternionArray(0)
+        quaternions._quaternions = _multiply(self._quaternions,
+                QuaternionArray._as_quaternions(other))
+        return quaternions
+
+    def inverse(self):
+        """Returns the inverse rotations (same axes, opposite angles)"""
+        quaternions = QuaternionArray(0)
+        quaternions._quaternions = self._quaternions * (1, -1, -1, -1)
+        return quaternions
+
+    def normalize(self):
+        """Renormalizes the quaternions in place"""
+        self._quaternions /= np.sqrt(np.sum(
+                self._quaternions * self._quaternions,
+                axis = -1))[:, np.newaxis]
+
+    def slerp(self, other, t):
+        """Spherical linear interpolation from self (t = 0) to other
+        (t = 1) along the shortest arcs. The other operand may be a
+        single quaternion, and t a single value or one per rotation.
+        """
+        other = QuaternionArray._as_quaternions(other)
+        quaternions = QuaternionArray(0)
+        quaternions._quaternions = _slerp(self._quaternions, other,
+                np.asfarray(t)[..., np.newaxis]).reshape(-1, 4)
+        return quaternions
+
+    @staticmethod
+    def _as_quaternions(rotations):
+        """Quaternions of a batch of rotations or of a single rotation,
+        either of which may be matrix rotations.
+        """
+        if isinstance(rotations, QuaternionArray):
+            return rotations._quaternions
+        if isinstance(rotations, Quaternion): return rotations._quaternion
+        return _matrices_quaternions(RotationArray._as_matrices(rotations))
+
+def _multiply(p, q):
+    """Hamilton products of (..., 4) arrays of quaternions"""
+    w1, x1, y1, z1 = np.rollaxis(np.asarray(p), -1)
+    w2, x2, y2, z2 = np.rollaxis(np.asarray(q), -1)
+    return np.stack((
+            w1 * w2 - x1 * x2 - y1 * y2 - z1 * z2,
+            w1 * x2 + x1 * w2 + y1 * z2 - z1 * y2,
+            w1 * y2 - x1 * z2 + y1 * w2 + z1 * x2,
+            w1 * z2 + x1 * y2 - y1 * x2 + z1 * w2), axis = -1)
+
+def _quaternions_matrices(quaternions):
+    """Rotation matrices of a (..., 4) array of unit quaternions"""
+    w, x, y, z = np.rollaxis(quaternions, -1)
+    matrices = np.empty(quaternions.shape[:-1] + (3, 3), np.float_)
+    matrices[..., 0, 0] = 1 - 2 * (y * y + z * z)
+    matrices[..., 0, 1] = 2 * (x * y - w * z)
+    matrices[..., 0, 2] = 2 * (x * z + w * y)
+    matrices[..., 1, 0] = 2 * (x * y + w * z)
+    matrices[..., 1, 1] = 1 - 2 * (x * x + z * z)
+    matrices[..., 1, 2] = 2 * (y * z - w * x)
+    matrices[..., 2, 0] = 2 * (x * z - w * y)
+    matrices[..., 2, 1] = 2 * (y * z + w * x)
+    matrices[..., 2, 2] = 1 - 2 * (x * x + y * y)
+    return matrices
+
+def _matrices_quaternions(matrices):
+    """Unit quaternions of a (..., 3, 3) array of rotation matrices,
+    with a positive real part. Each row of the symmetric matrix below is
+    a quaternion scaled by 4 times one of its components, and the row
+    with the largest diagonal element is used for numerical stability.
+    """
+    m = np.asfarray(matrices)
+    m00, m11, m22 = m[..., 0, 0], m[..., 1, 1], m[..., 2, 2]
+    x = m[..., 2, 1] - m[..., 1, 2]
+    y = m[..., 0, 2] - m[..., 2, 0]
+    z = m[..., 1, 0] - m[..., 0, 1]
+    xy = m[..., 0, 1] + m[..., 1, 0]
+    xz = m[..., 0, 2] + m[..., 2, 0]
+    yz = m[..., 1, 2] + m[..., 2, 1]
+    rows = np.stack((
+            np.stack((1 + m00 + m11 + m22, x, y, z), axis = -1),
+            np.stack((x, 1 + m00 - m11 - m22, xy, xz), axis = -1),
+            np.stack((y, xy, 1 - m00 + m11 - m22, yz), axis = -1),
+            np.stack((z, xz, yz, 1 - m00 - m11 + m22), axis = -1)),
+            axis = -2)
+    rows = rows.reshape(-1, 4, 4)
+    best = np.argmax(np.diagonal(rows, axis1 = 1, axis2 = 2), axis = 1)
+    quaternions = rows[np.arange(len(rows)), best]
+    quaternions = quaternions.reshape(m.shape[:-2] + (4,))
+    quaternions /= np.sqrt(np.sum(
+            quaternions * quaternions, axis = -1))[..., np.newaxis]
+    quaternions *= np.where(quaternions[..., :1] < 0, -1, 1)
+    return quaternions
+
+def _slerp(p, q, t):
+    """Spherical linear interpolation between (..., 4) arrays of unit
+    quaternions, along the shortest arcs.
+    """
+    dots = np.sum(p * q, axis = -1)[..., np.newaxis]
+    q = np.where(dots < 0, -q, q)
+    dots = np.abs(dots)
+    angles = np.arccos(np.minimum(dots, 1))
+    sines = np.sin(angles)
+    # Linear interpolation where the quaternions are too close
+    close = sines < 1e-6
+    sines = np.where(close, 1, sines)
+    p_weights = np.where(close, 1 - t, np.sin((1 - t) * angles) / sines)
+    q_weights = np.where(close, t, np.sin(t * angles) / sines)
+    quaternions = p_weights * p + q_weights * q
+    return quaternions / np.sqrt(np.sum(
+            quaternions * quaternions, axis = -1))[..., np.newaxis]
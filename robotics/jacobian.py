@@ -1,35 +1,77 @@
 import numpy as np
 
+class SolverResult:
+    """Outcome of an iterative solve"""
+
+    def __init__(self, input_vector, output_vector, iterations, error,
+            converged):
+        """Constructor. The error is the norm of the output error vector.
+        The solve converged if the error is within the output tolerance.
+        """
+        self.input_vector = input_vector
+        self.output_vector = output_vector
+        self.iterations = iterations
+        self.error = error
+        self.converged = converged
+
 class JacobianSolver:
     """Base class for numeric solvers using Jacobian matrices"""
 
     def __init__(self, function,
+            jacobian = None,
+            dependency_mask = None,
             max_input_fix = None,
             max_output_error = None,
             input_delta = 0.001):
-        """Constructor"""
-        self._function = function
-        self._max_input_fix = max_input_fix
-        if max_input_fix == None: self._max_input_fix = None
-        else: self._max_input_fix = float(max_input_fix)
-        if max_output_error == None: self._max_output_error = None
-        else: self._max_output_error = float(max_output_error)
-        self._input_delta = float(input_delta)
+        """Constructor. The optional Jacobian function maps an input
+        vector to the exact Jacobian matrix of the function, in which
+        case finite differences are not used.
+
+        The optional dependency mask is a boolean matrix shaped as the
+        Jacobian matrix which is False where an output component never
+        depends on an input component. Inputs which do not share any
+        output are then probed together by finite differences, and
+        independent blocks of the system are solved separately.
+        """
+        _initialize_options(self, function, jacobian, max_input_fix,
+                max_output_error, input_delta)
+        if dependency_mask is None:
+            self._dependency_mask = None
+            self._probe_groups = None
+            self._blocks = None
+        else:
+            self._dependency_mask = np.asarray(dependency_mask, np.bool_)
+            self._probe_groups = JacobianSolver._probe_groups(
+                    self._dependency_mask)
+            self._blocks = JacobianSolver._blocks(self._dependency_mask)
 
     def _jacobian_transpose_matrix(self, input_vector, output_vector = None):
         """Jacobian transpose matrix of the function at the input vector"""
         input_vector = np.asfarray(input_vector)
+        if self._jacobian is not None:
+            return np.transpose(np.asfarray(self._jacobian(input_vector)))
         if (output_vector == None):
             output_vector = self._function(input_vector)
         output_vector = np.asfarray(output_vector)
         matrix = np.zeros((len(input_vector), len(output_vector)))
-        for i in xrange(len(input_vector)):
-            altered_input_vector = input_vector.copy()
-            altered_input_vector[i] += self._input_delta
-            altered_output_vector = self._function(altered_input_vector)
-            altered_output_vector = np.asfarray(altered_output_vector)
-            output_delta_vector = altered_output_vector - output_vector
-            matrix[i] = output_delta_vector / self._input_delta
+        if self._probe_groups is None:
+            for i in xrange(len(input_vector)):
+                altered_input_vector = input_vector.copy()
+                altered_input_vector[i] += self._input_delta
+                altered_output_vector = self._function(altered_input_vector)
+                altered_output_vector = np.asfarray(altered_output_vector)
+                output_delta_vector = altered_output_vector - output_vector
+                matrix[i] = output_delta_vector / self._input_delta
+        else:
+            mask = np.transpose(self._dependency_mask)
+            for group in self._probe_groups:
+                altered_input_vector = input_vector.copy()
+                altered_input_vector[group] += self._input_delta
+                altered_output_vector = self._function(altered_input_vector)
+                altered_output_vector = np.asfarray(altered_output_vector)
+                output_delta_vector = altered_output_vector - output_vector
+                matrix[group] = np.where(mask[group],
+                        output_delta_vector / self._input_delta, 0)
         return matrix
 
     def _jacobian_matrix(self, **kwargs):
@@ -45,32 +87,166 @@ class JacobianSolver:
         if (output_vector == None):
             output_vector = self._function(input_vector)
         output_vector = np.asfarray(output_vector)
-        matrix = self._solver_matrix(
+        jacobian_transpose_matrix = self._jacobian_transpose_matrix(
                 input_vector = input_vector,
                 output_vector = output_vector)
+        return self._step(input_vector, target_output_vector, output_vector,
+                jacobian_transpose_matrix)
+
+    def solve(self, input_vector, target_output_vector, output_vector = None,
+            max_iterations = 100,
+            output_tolerance = 1e-6,
+            input_tolerance = 1e-9):
+        """Iterate until the norm of the output error vector is within
+        the output tolerance, the norm of the input fix vector is within
+        the input tolerance, or the maximum number of iterations is
+        reached. Returns a SolverResult.
+        """
+        input_vector = np.asfarray(input_vector)
+        target_output_vector = np.asfarray(target_output_vector)
+        if output_vector is None:
+            output_vector = self._function(input_vector)
+        output_vector = np.asfarray(output_vector)
+        error = np.linalg.norm(target_output_vector - output_vector)
+        self._start_solve()
+        iterations = 0
+        jacobian_transpose_matrix = None
+        while error > output_tolerance and iterations < max_iterations:
+            iterations += 1
+            if jacobian_transpose_matrix is None:
+                jacobian_transpose_matrix = self._jacobian_transpose_matrix(
+                        input_vector = input_vector,
+                        output_vector = output_vector)
+            new_input_vector = self._step(input_vector, target_output_vector,
+                    output_vector, jacobian_transpose_matrix)
+            new_output_vector = np.asfarray(self._function(new_input_vector))
+            new_error = np.linalg.norm(
+                    target_output_vector - new_output_vector)
+            input_fix = np.linalg.norm(new_input_vector - input_vector)
+            accepted = self._accept_step(new_error < error)
+            if accepted:
+                input_vector = new_input_vector
+                output_vector = new_output_vector
+                error = new_error
+            if not self._reuse_jacobian(accepted):
+                jacobian_transpose_matrix = None
+            if input_fix <= input_tolerance: break
+        return SolverResult(
+                input_vector = input_vector,
+                output_vector = output_vector,
+                iterations = iterations,
+                error = error,
+                converged = error <= output_tolerance)
+
+    def _start_solve(self):
+        """Called at the start of each solve"""
+        pass
+
+    def _accept_step(self, improved):
+        """Whether a step is accepted given whether it improved the
+        error. Steps are always accepted unless a solver adapts.
+        """
+        return True
+
+    def _reuse_jacobian(self, accepted):
+        """Whether the Jacobian matrix is reused for the next step of a
+        solve. It is only reused at the same input vector.
+        """
+        return not accepted
+
+    def _step(self, input_vector, target_output_vector, output_vector,
+            jacobian_transpose_matrix):
+        """Improved input vector given the Jacobian transpose matrix at
+        the input vector.
+        """
+        matrix = self._solver_matrix(jacobian_transpose_matrix)
         output_error_vector = target_output_vector - output_vector
         JacobianSolver._limit_norm(output_error_vector, self._max_output_error)
         input_fix_vector = np.dot(matrix, output_error_vector)
         JacobianSolver._limit_component(input_fix_vector, self._max_input_fix)
         return input_vector + input_fix_vector
 
+    def _solver_matrix(self, jacobian_transpose_matrix):
+        """Solver matrix mapping an output error vector to an input fix
+        vector. Independent blocks of the system are solved separately.
+        """
+        if self._blocks is None:
+            return self._inverse_matrix(jacobian_transpose_matrix)
+        matrix = np.zeros(jacobian_transpose_matrix.shape)
+        for inputs, outputs in self._blocks:
+            block = np.ix_(inputs, outputs)
+            matrix[block] = self._inverse_matrix(
+                    jacobian_transpose_matrix[block])
+        return matrix
+
+    @staticmethod
+    def _probe_groups(dependency_mask):
+        """Greedily groups the input components whose sets of dependent
+        output components are disjoint, so that they can be probed at
+        the same time.
+        """
+        groups = list()
+        groups_outputs = list()
+        for i in xrange(dependency_mask.shape[1]):
+            outputs = dependency_mask[:, i]
+            for group, group_outputs in zip(groups, groups_outputs):
+                if not np.any(group_outputs & outputs):
+                    group.append(i)
+                    group_outputs |= outputs
+                    break
+            else:
+                groups.append([i])
+                groups_outputs.append(outputs.copy())
+        return groups
+
     @staticmethod
-    def _limit_component(vector, max_component):
-        """Scale a vector so that no components exceeds a maximum"""
-        if max_component == None: return
-        assert vector.dtype == np.float_
-        highest_component = np.amax(np.absolute(vector))
-        if highest_component > max_component:
-            np.multiply(vector, max_component / highest_component, vector)
+    def _blocks(dependency_mask):
+        """Splits the system into independent blocks. Returns the input
+        and output components of each connected component of the
+        dependency graph.
+        """
+        inputs_count = dependency_mask.shape[1]
+        remaining_inputs = np.ones(inputs_count, np.bool_)
+        blocks = list()
+        for i in xrange(inputs_count):
+            if not remaining_inputs[i]: continue
+            inputs = np.zeros(inputs_count, np.bool_)
+            inputs[i] = True
+            while True:
+                outputs = np.any(dependency_mask[:, inputs], axis = 1)
+                new_inputs = np.any(dependency_mask[outputs], axis = 0)
+                new_inputs |= inputs
+                if np.array_equal(new_inputs, inputs): break
+                inputs = new_inputs
+            remaining_inputs &= ~inputs
+            if np.any(outputs):
+                blocks.append(
+                        (np.flatnonzero(inputs), np.flatnonzero(outputs)))
+        return blocks
 
     @staticmethod
-    def _limit_norm(vector, max_norm):
-        """Scale a vector so that the norm does not exceed a maximum"""
-        if max_norm == None: return
-        assert vector.dtype == np.float_
-        norm = np.linalg.norm(vector)
-        if norm > max_norm:
-            np.multiply(vector, max_norm / norm, vector)
+    def _limit_component(vectors, max_component):
+        """Scale each of a (K, N) array of vectors in place so that no
+        component exceeds a maximum. A single vector is a batch of one.
+        """
+        if max_component is None: return
+        assert vectors.dtype == np.float_
+        vectors = np.atleast_2d(vectors)
+        highest_components = np.amax(np.absolute(vectors), axis = 1)
+        scales = max_component / np.maximum(highest_components, max_component)
+        vectors *= scales[:, np.newaxis]
+
+    @staticmethod
+    def _limit_norm(vectors, max_norm):
+        """Scale each of a (K, N) array of vectors in place so that its
+        norm does not exceed a maximum. A single vector is a batch of one.
+        """
+        if max_norm is None: return
+        assert vectors.dtype == np.float_
+        vectors = np.atleast_2d(vectors)
+        norms = np.sqrt(np.sum(vectors**2, axis = 1))
+        scales = max_norm / np.maximum(norms, max_norm)
+        vectors *= scales[:, np.newaxis]
 
 class JacobianInverseSolver(JacobianSolver):
     """Numeric solver using the Jacobian inverse technique"""
@@ -79,25 +255,330 @@ class JacobianInverseSolver(JacobianSolver):
         """Constructor"""
         JacobianSolver.__init__(self, **kwargs)
 
-    def _solver_matrix(self, **kwargs):
-        """Jacobian inverse matrix of the function at the input vector"""
-        return np.linalg.pinv(self._jacobian_matrix(**kwargs))
+    def _inverse_matrix(self, jacobian_transpose_matrix):
+        """Jacobian inverse matrix"""
+        return np.linalg.pinv(np.transpose(jacobian_transpose_matrix))
 
 class DampedLeastSquaresSolver(JacobianSolver):
-    """Numeric solver using the Damped Least Squares (DLS) technique"""
+    """Numeric solver using the Damped Least Squares (DLS) technique.
 
-    def __init__(self, constant, **kwargs):
+    Single steps use the damping constant. Solves adapt the damping in
+    the manner of Levenberg-Marquardt: it decreases after each step
+    which reduces the error, toward Gauss-Newton steps, and increases
+    after each step which does not, in which case the step is rejected.
+    """
+
+    def __init__(self, constant,
+            min_constant = 1e-3,
+            max_constant = 1e3,
+            **kwargs):
         """Constructor"""
-        self._constant = constant
+        _initialize_damping(self, constant, min_constant, max_constant)
+        self._damping = self._constant
         JacobianSolver.__init__(self, **kwargs)
 
-    def _solver_matrix(self, **kwargs):
-        """Damped Least Squares matrix"""
-        jacobian_transpose_matrix = self._jacobian_transpose_matrix(**kwargs)
+    def _start_solve(self):
+        """Start from the damping constant"""
+        self._damping = self._constant
+
+    def _accept_step(self, improved):
+        """Adapt the damping. Only steps which improve are accepted."""
+        self._damping = float(_adapt_damping(self, self._damping, improved))
+        return improved
+
+    def converge(self, input_vector, target_output_vector,
+            output_vector = None):
+        """Single step using the damping constant"""
+        self._damping = self._constant
+        return JacobianSolver.converge(self,
+                input_vector = input_vector,
+                target_output_vector = target_output_vector,
+                output_vector = output_vector)
+
+    def _inverse_matrix(self, jacobian_transpose_matrix):
+        """Damped Least Squares matrix. As the damped square matrix is
+        symmetric, the matrix is the transpose of the solution of a
+        linear system rather than the product by an explicit inverse.
+        """
         jacobian_matrix = np.transpose(jacobian_transpose_matrix)
         square_matrix = np.dot(jacobian_matrix, jacobian_transpose_matrix)
         size = square_matrix.shape[0]
         identity = np.identity(size)
-        return np.dot(
-                jacobian_transpose_matrix,
-                np.linalg.inv(square_matrix + self._constant**2 * identity))
+        return np.transpose(np.linalg.solve(
+                square_matrix + self._damping**2 * identity,
+                jacobian_matrix))
+
+class BroydenSolver(DampedLeastSquaresSolver):
+    """Damped Least Squares solver using a quasi-Newton estimate of the
+    Jacobian matrix. The estimate is kept across calls and updated with
+    Broyden rank-one updates from the observed input and output vector
+    changes, which costs no function evaluation. It is only refreshed
+    (by finite differences or the Jacobian function) when the error
+    stops decreasing.
+    """
+
+    def __init__(self, constant, **kwargs):
+        """Constructor"""
+        DampedLeastSquaresSolver.__init__(self, constant, **kwargs)
+        self._estimate = None
+        self._fresh = False
+        self._stale = False
+        self._previous_input_vector = None
+        self._previous_output_vector = None
+        self._previous_target_output_vector = None
+        self._previous_error = None
+
+    def refresh(self):
+        """Force the estimate to be refreshed at the next step"""
+        self._stale = True
+
+    def converge(self, input_vector, target_output_vector,
+            output_vector = None):
+        """Single step using the damping constant. The estimate is
+        refreshed if the previous step did not get closer to its target.
+        """
+        input_vector = np.asfarray(input_vector)
+        target_output_vector = np.asfarray(target_output_vector)
+        if output_vector is None:
+            output_vector = self._function(input_vector)
+        output_vector = np.asfarray(output_vector)
+        if self._previous_error is not None:
+            error = np.linalg.norm(
+                    self._previous_target_output_vector - output_vector)
+            if error >= self._previous_error: self._stale = True
+        self._previous_target_output_vector = target_output_vector
+        self._previous_error = np.linalg.norm(
+                target_output_vector - output_vector)
+        return DampedLeastSquaresSolver.converge(self,
+                input_vector = input_vector,
+                target_output_vector = target_output_vector,
+                output_vector = output_vector)
+
+    def solve(self, input_vector, target_output_vector, output_vector = None,
+            **kwargs):
+        """Iterate as for a JacobianSolver. For the next converge, the
+        whole solve counts as the previous step, so the estimate is
+        refreshed if the solve did not get closer to its target.
+        """
+        input_vector = np.asfarray(input_vector)
+        target_output_vector = np.asfarray(target_output_vector)
+        if output_vector is None:
+            output_vector = self._function(input_vector)
+        output_vector = np.asfarray(output_vector)
+        result = DampedLeastSquaresSolver.solve(self,
+                input_vector = input_vector,
+                target_output_vector = target_output_vector,
+                output_vector = output_vector,
+                **kwargs)
+        self._previous_target_output_vector = target_output_vector
+        if result.iterations > 0:
+            self._previous_error = np.linalg.norm(
+                    target_output_vector - output_vector)
+        else:
+            self._previous_error = None
+        return result
+
+    def _reuse_jacobian(self, accepted):
+        """After a rejected step the estimate is refreshed, unless it was
+        just refreshed.
+        """
+        if accepted: return False
+        if self._fresh: return True
+        self._stale = True
+        return False
+
+    def _jacobian_transpose_matrix(self, input_vector, output_vector = None):
+        """Estimate of the Jacobian transpose matrix at the input vector"""
+        input_vector = np.asfarray(input_vector)
+        if output_vector is None:
+            output_vector = self._function(input_vector)
+        output_vector = np.asfarray(output_vector)
+        if self._estimate is None or self._stale:
+            self._estimate = JacobianSolver._jacobian_transpose_matrix(self,
+                    input_vector = input_vector,
+                    output_vector = output_vector)
+            self._fresh = True
+            self._stale = False
+        else:
+            self._update(input_vector - self._previous_input_vector,
+                    output_vector - self._previous_output_vector)
+        self._previous_input_vector = input_vector.copy()
+        self._previous_output_vector = output_vector.copy()
+        return self._estimate
+
+    def _update(self, input_delta_vector, output_delta_vector):
+        """Broyden rank-one update of the estimate"""
+        norm = np.dot(input_delta_vector, input_delta_vector)
+        if norm == 0: return
+        self._fresh = False
+        output_miss_vector = output_delta_vector - \
+                np.dot(input_delta_vector, self._estimate)
+        self._estimate = self._estimate + np.outer(
+                input_delta_vector, output_miss_vector / norm)
+        if self._dependency_mask is not None:
+            self._estimate[~np.transpose(self._dependency_mask)] = 0
+
+class BatchDampedLeastSquaresSolver:
+    """Damped Least Squares solver for K independent problems sharing the
+    same structure. The function maps a (K, N) array of input vectors to
+    a (K, M) array of output vectors, row by row, so that any subset of
+    the rows can be evaluated. The Jacobian matrices, damping and input
+    fixes of all the problems are processed as stacked arrays.
+    """
+
+    def __init__(self, function, constant,
+            jacobian = None,
+            max_input_fix = None,
+            max_output_error = None,
+            input_delta = 0.001,
+            min_constant = 1e-3,
+            max_constant = 1e3):
+        """Constructor. The optional Jacobian function maps a (K, N) array
+        of input vectors to the (K, M, N) array of the exact Jacobian
+        matrices, in which case finite differences are not used.
+        """
+        _initialize_options(self, function, jacobian, max_input_fix,
+                max_output_error, input_delta)
+        _initialize_damping(self, constant, min_constant, max_constant)
+
+    def _jacobian_matrices(self, input_vectors, output_vectors):
+        """Jacobian matrices of the function at the input vectors"""
+        if self._jacobian is not None:
+            return np.asfarray(self._jacobian(input_vectors))
+        count, input_size = input_vectors.shape
+        matrices = np.empty((count, output_vectors.shape[1], input_size))
+        for i in xrange(input_size):
+            altered_input_vectors = input_vectors.copy()
+            altered_input_vectors[:, i] += self._input_delta
+            altered_output_vectors = np.asfarray(
+                    self._function(altered_input_vectors))
+            matrices[:, :, i] = (altered_output_vectors - output_vectors) / \
+                    self._input_delta
+        return matrices
+
+    def converge(self, input_vectors, target_output_vectors,
+            output_vectors = None):
+        """Attempt to calculate improved input vectors so that the output
+        vectors converge toward the targets, using the damping constant.
+        """
+        input_vectors = np.asfarray(input_vectors)
+        target_output_vectors = np.asfarray(target_output_vectors)
+        if output_vectors is None:
+            output_vectors = self._function(input_vectors)
+        output_vectors = np.asfarray(output_vectors)
+        matrices = self._jacobian_matrices(input_vectors, output_vectors)
+        dampings = np.empty(len(input_vectors))
+        dampings.fill(self._constant)
+        return self._step(input_vectors, target_output_vectors,
+                output_vectors, matrices, dampings)
+
+    def solve(self, input_vectors, target_output_vectors,
+            output_vectors = None,
+            max_iterations = 100,
+            output_tolerance = 1e-6,
+            input_tolerance = 1e-9):
+        """Iterate each problem until the norm of its output error vector
+        is within the output tolerance, the norm of its input fix vector
+        is within the input tolerance, or the maximum number of
+        iterations is reached. Only the active problems are evaluated.
+        The damping of each problem adapts as in DampedLeastSquaresSolver.
+        Returns a SolverResult whose iterations, error and converged
+        attributes are arrays with one value per problem.
+        """
+        input_vectors = np.array(input_vectors, np.float_)
+        target_output_vectors = np.asfarray(target_output_vectors)
+        if output_vectors is None:
+            output_vectors = self._function(input_vectors)
+        output_vectors = np.array(output_vectors, np.float_)
+        errors = np.sqrt(np.sum(
+                (target_output_vectors - output_vectors)**2, axis = 1))
+        count = len(input_vectors)
+        dampings = np.empty(count)
+        dampings.fill(self._constant)
+        iterations = np.zeros(count, np.int_)
+        matrices = np.empty((count, output_vectors.shape[1],
+                input_vectors.shape[1]))
+        stale = np.ones(count, np.bool_)
+        active = (errors > output_tolerance) & (iterations < max_iterations)
+        while np.any(active):
+            indices = np.flatnonzero(active)
+            iterations[indices] += 1
+            refresh = indices[stale[indices]]
+            if len(refresh) > 0:
+                matrices[refresh] = self._jacobian_matrices(
+                        input_vectors[refresh], output_vectors[refresh])
+                stale[refresh] = False
+            new_input_vectors = self._step(input_vectors[indices],
+                    target_output_vectors[indices], output_vectors[indices],
+                    matrices[indices], dampings[indices])
+            new_output_vectors = np.asfarray(
+                    self._function(new_input_vectors))
+            new_errors = np.sqrt(np.sum((target_output_vectors[indices] -
+                    new_output_vectors)**2, axis = 1))
+            input_fixes = np.sqrt(np.sum(
+                    (new_input_vectors - input_vectors[indices])**2, axis = 1))
+            # Accept improving steps and adapt the damping
+            improved = new_errors < errors[indices]
+            accepted = indices[improved]
+            input_vectors[accepted] = new_input_vectors[improved]
+            output_vectors[accepted] = new_output_vectors[improved]
+            errors[accepted] = new_errors[improved]
+            stale[accepted] = True
+            dampings[indices] = _adapt_damping(
+                    self, dampings[indices], improved)
+            # Deactivate finished problems
+            active[indices] = (errors[indices] > output_tolerance) & \
+                    (input_fixes > input_tolerance) & \
+                    (iterations[indices] < max_iterations)
+        return SolverResult(
+                input_vector = input_vectors,
+                output_vector = output_vectors,
+                iterations = iterations,
+                error = errors,
+                converged = errors <= output_tolerance)
+
+    def _step(self, input_vectors, target_output_vectors, output_vectors,
+            matrices, dampings):
+        """Improved input vectors given the Jacobian matrices and damping
+        constants of the problems.
+        """
+        output_error_vectors = target_output_vectors - output_vectors
+        JacobianSolver._limit_norm(
+                output_error_vectors, self._max_output_error)
+        transposed_matrices = np.transpose(matrices, (0, 2, 1))
+        square_matrices = np.matmul(matrices, transposed_matrices)
+        size = square_matrices.shape[1]
+        square_matrices += dampings[:, np.newaxis, np.newaxis]**2 * \
+                np.identity(size)
+        input_fix_vectors = np.matmul(transposed_matrices, np.linalg.solve(
+                square_matrices, output_error_vectors[..., np.newaxis]))
+        input_fix_vectors = input_fix_vectors[..., 0]
+        JacobianSolver._limit_component(
+                input_fix_vectors, self._max_input_fix)
+        return input_vectors + input_fix_vectors
+
+def _initialize_options(solver, function, jacobian, max_input_fix,
+        max_output_error, input_delta):
+    """Sets the options shared by the Jacobian solvers"""
+    solver._function = function
+    solver._jacobian = jacobian
+    if max_input_fix is None: solver._max_input_fix = None
+    else: solver._max_input_fix = float(max_input_fix)
+    if max_output_error is None: solver._max_output_error = None
+    else: solver._max_output_error = float(max_output_error)
+    solver._input_delta = float(input_delta)
+
+def _initialize_damping(solver, constant, min_constant, max_constant):
+    """Sets the damping options of the Damped Least Squares solvers"""
+    solver._constant = float(constant)
+    solver._min_constant = float(min_constant)
+    solver._max_constant = float(max_constant)
+
+def _adapt_damping(solver, dampings, improved):
+    """Damping after a step, or steps, given whether it improved the
+    error: halved down to the minimum, or else quadrupled up to the
+    maximum.
+    """
+    return np.where(improved,
+            np.maximum(np.divide(dampings, 2.), solver._min_constant),
+            np.minimum(np.multiply(dampings, 4.), solver._max_constant))
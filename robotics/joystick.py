@@ -1,9 +1,28 @@
-import struct, array
+import struct, array, os, threading
 from fcntl import ioctl
 from select import select
 
+class JoystickState:
+    """Snapshot of the state of a joystick"""
+
+    def __init__(self, axis_states, button_states, time):
+        """Constructor. The time is the driver timestamp in milliseconds
+        of the last event applied, or None if no event was read yet.
+        """
+        self.axis_states = axis_states
+        self.button_states = button_states
+        self.time = time
+
 class Joystick:
 
+    # Size of a driver event, and number of events read at once
+    event_size = struct.calcsize('IhBB')
+    read_events = 64
+
+    # Seconds the reader thread waits for events before checking whether
+    # it was stopped
+    poll_interval = 0.1
+
     axis_names = {
         0x00 : 'x',
         0x01 : 'y',
@@ -108,23 +127,125 @@ class Joystick:
             self.button_map.append(btn_name)
             self.button_states[btn_name] = 0
 
+        self._initialize_reader(self._jsdev.fileno())
+
+    def _initialize_reader(self, fd):
+        """Sets up reading the events from a file descriptor, once the
+        axis and button maps and states are known.
+        """
+        self._fd = fd
+        self._pending = ''
+        self._thread = None
+        self._running = False
+        self._error = None
+        self._snapshot = JoystickState(dict(self.axis_states),
+                dict(self.button_states), None)
+
     def update(self):
+        """Bring the axis and button states up to date. If the reader
+        thread is running, the latest snapshot is adopted without any
+        I/O; otherwise all the available events are read. Raises the
+        error which stopped the reader thread, if any.
+        """
+        self._check()
+        if self._running:
+            snapshot = self._snapshot
+            self.axis_states = dict(snapshot.axis_states)
+            self.button_states = dict(snapshot.button_states)
+            return
+        time = self._snapshot.time
+        while self._fd in select([self._fd], [], [], 0)[0]:
+            evbuf = os.read(self._fd, Joystick.event_size *
+                    Joystick.read_events)
+            if not evbuf: raise IOError('Joystick device was closed')
+            time = self._decode(evbuf, self.axis_states,
+                    self.button_states, time)
+        self._snapshot = JoystickState(dict(self.axis_states),
+                dict(self.button_states), time)
+
+    def snapshot(self):
+        """Latest JoystickState. It is published as a whole, so its axis
+        states, button states and time are consistent with each other.
+        It must not be modified. Raises the error which stopped the
+        reader thread, if any, rather than return a stale state.
+        """
+        self._check()
+        return self._snapshot
+
+    def start(self):
+        """Start a background thread which reads the events as they
+        arrive and publishes a new snapshot after each batch.
+        """
+        if self._running: return
+        self._running = True
+        self._thread = threading.Thread(target = self._read_loop)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stop the background thread"""
+        if self._thread is None: return
+        self._running = False
+        self._thread.join()
+        self._thread = None
+        snapshot = self._snapshot
+        self.axis_states = dict(snapshot.axis_states)
+        self.button_states = dict(snapshot.button_states)
+
+    def _check(self):
+        """Raises the error which stopped the reader thread, if any"""
+        if self._error is not None: raise self._error
+
+    def _read_loop(self):
+        """Body of the background thread. An error, or the device being
+        closed, stops the thread and is recorded so that the readers of
+        the state do not keep using stale values.
+        """
+        snapshot = self._snapshot
+        axis_states = dict(snapshot.axis_states)
+        button_states = dict(snapshot.button_states)
+        time = snapshot.time
+        try:
+            while self._running:
+                if not select([self._fd], [], [],
+                        Joystick.poll_interval)[0]:
+                    continue
+                evbuf = os.read(self._fd, Joystick.event_size *
+                        Joystick.read_events)
+                if not evbuf: raise IOError('Joystick device was closed')
+                time = self._decode(
+                        evbuf, axis_states, button_states, time)
+                # Replacing the reference is atomic, so readers never see
+                # a partially applied batch
+                self._snapshot = JoystickState(dict(axis_states),
+                        dict(button_states), time)
+        except Exception as error:
+            self._error = error
+        finally:
+            self._running = False
+
+    def _decode(self, evbuf, axis_states, button_states, time):
+        """Apply a batch of events to axis and button states. Returns
+        the timestamp of the last event, or the given one if the batch
+        holds no complete event.
+        """
+        evbuf = self._pending + evbuf
+        count = len(evbuf) // Joystick.event_size
+        size = count * Joystick.event_size
+        self._pending = evbuf[size:]
+        values = struct.unpack('IhBB' * count, evbuf[:size])
+        for i in xrange(0, 4 * count, 4):
+            time, value, type, number = values[i:i + 4]
+
+            # Button event
+            if type & 0x01:
+                button = self.button_map[number]
+                if button:
+                    button_states[button] = value
 
-        # Read all the available events
-        while self._jsdev in select([self._jsdev], [], [], 0)[0]:
-            evbuf = self._jsdev.read(8)
-            if evbuf:
-                time, value, type, number = struct.unpack('IhBB', evbuf)
-
-                # Button event
-                if type & 0x01:
-                    button = self.button_map[number]
-                    if button:
-                        self.button_states[button] = value
-
-                # Axis event
-                if type & 0x02:
-                    axis = self.axis_map[number]
-                    if axis:
-                        fvalue = value / 32767.0
-                        self.axis_states[axis] = fvalue
+            # Axis event
+            if type & 0x02:
+                axis = self.axis_map[number]
+                if axis:
+                    axis_states[axis] = value / 32767.0
+        return time
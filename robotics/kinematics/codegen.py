@@ -0,0 +1,203 @@
+import numpy as np
+import hashlib
+import inspect
+import re
+import sys
+
+def generate_source(compiled_tree, endpoints, jacobian = False):
+    """Generate the source of a module specialized for a compiled tree
+    and a list of endpoints keys. The module defines a forward
+    kinematics function mapping a joints angles vector to the stacked
+    endpoints translations, and optionally a function mapping it to the
+    positional Jacobian matrix of the endpoints.
+
+    The functions are straight-line scalar code. The fixed displacements
+    of the compiled tree are inlined as constants and folded, so that
+    zero terms and unit factors disappear, and only the joints upstream
+    of the endpoints are evaluated.
+    """
+    indices = [compiled_tree.index(key) for key in endpoints]
+    lines = ['# Generated by CompiledTree.generate for endpoints ' +
+            ', '.join(endpoints), '',
+            'import math',
+            'import numpy as np', '',
+            'def endpoints(joints_angles):',
+            '    """Stacked translations of the endpoints"""']
+    writer = _SourceWriter(compiled_tree)
+    translations = [writer.translation(i) for i in indices]
+    result = 'np.array(' + _tuple(sum(translations, [])) + ')'
+    lines.extend(_prune(writer.lines, result))
+    lines.append('    return ' + result)
+    if jacobian:
+        lines.extend(['', 'def jacobian(joints_angles):',
+                '    """Positional Jacobian matrix of the endpoints"""'])
+        writer = _SourceWriter(compiled_tree)
+        rows = list()
+        for i in indices:
+            rows.extend(writer.jacobian_rows(i))
+        result = 'np.array(' + _tuple([_tuple(row) for row in rows]) + ')'
+        lines.extend(_prune(writer.lines, result))
+        lines.append('    return ' + result)
+    return '\n'.join(lines) + '\n'
+
+def compile_source(source, filename = '<generated>'):
+    """Execute generated source and return its namespace"""
+    namespace = dict()
+    exec compile(source, filename, 'exec') in namespace
+    return namespace
+
+def generator_fingerprint():
+    """Hash of the source of this generator, so that the generated source
+    cached by an older version of it is not used.
+    """
+    global _generator_fingerprint
+    if _generator_fingerprint is None:
+        _generator_fingerprint = hashlib.sha1(
+                inspect.getsource(sys.modules[__name__])).hexdigest()
+    return _generator_fingerprint
+
+_generator_fingerprint = None
+
+class _SourceWriter:
+    """Writes the statements evaluating the nodes of a compiled tree.
+
+    Values are either float constants or the names of local variables.
+    The world rotation matrix and translation of each evaluated node
+    are kept as nested lists of values.
+    """
+
+    # Constants below this magnitude are folded to zero
+    epsilon = 1e-15
+
+    def __init__(self, compiled_tree):
+        """Constructor"""
+        self._tree = compiled_tree
+        self._rotations = dict()
+        self._translations = dict()
+        self._count = 0
+        self.lines = list()
+
+    def translation(self, i):
+        """World translation of a node"""
+        self._evaluate(i)
+        return self._translations[i]
+
+    def jacobian_rows(self, i):
+        """Rows of the positional Jacobian matrix for the translation of
+        a node, one per component.
+        """
+        tree = self._tree
+        translation = self.translation(i)
+        rows = [[0.0] * tree._joints_count for _ in xrange(3)]
+        for slot in np.flatnonzero(tree._joints_ancestry[i]):
+            joint = tree._joints_indices[slot]
+            self._evaluate(joint)
+            # The world axis of a joint is the same before and after its
+            # own rotation.
+            rotation = self._rotations[joint]
+            axis = [self._sum([(rotation[j][k], tree._axes[joint][k])
+                for k in xrange(3)]) for j in xrange(3)]
+            arm = [self._sum([(translation[j],),
+                (-1.0, self._translations[joint][j])])
+                for j in xrange(3)]
+            for j in xrange(3):
+                k, l = (j + 1) % 3, (j + 2) % 3
+                rows[j][slot] = self._sum(
+                        [(axis[k], arm[l]), (-1.0, axis[l], arm[k])])
+        return rows
+
+    def _evaluate(self, i):
+        """Write the statements evaluating a node and its anchors"""
+        if i in self._translations: return
+        tree = self._tree
+        anchor = tree._anchors[i]
+        if anchor >= 0: self._evaluate(anchor)
+        slot = tree._joints_slots[i]
+        if slot >= 0:
+            cos = self._variable(
+                    'math.cos(joints_angles[' + str(slot) + '])')
+            sin = self._variable(
+                    'math.sin(joints_angles[' + str(slot) + '])')
+            # Rodrigues formula with the constant part of the outer
+            # product term folded
+            local_rotation = [[self._sum([
+                    (tree._fixed_rotations[i, j, k] -
+                        tree._fixed_outer[i, j, k], cos),
+                    (tree._fixed_cross[i, j, k], sin),
+                    (tree._fixed_outer[i, j, k],)])
+                for k in xrange(3)] for j in xrange(3)]
+        else:
+            local_rotation = tree._fixed_rotations[i].tolist()
+        local_translation = tree._fixed_translations[i].tolist()
+        if anchor < 0:
+            self._rotations[i] = local_rotation
+            self._translations[i] = local_translation
+            return
+        rotation = self._rotations[anchor]
+        translation = self._translations[anchor]
+        # Only the joints rotations are used, as anchors or axes
+        if slot >= 0:
+            self._rotations[i] = [[self._sum(
+                    [(rotation[j][l], local_rotation[l][k])
+                        for l in xrange(3)])
+                    for k in xrange(3)] for j in xrange(3)]
+        else:
+            self._rotations[i] = None
+        self._translations[i] = [self._sum(
+                [(translation[j],)] +
+                [(rotation[j][l], local_translation[l]) for l in xrange(3)])
+                for j in xrange(3)]
+
+    def _variable(self, expression):
+        """Assign an expression to a new local variable"""
+        name = 'v' + str(self._count)
+        self._count += 1
+        self.lines.append('    ' + name + ' = ' + expression)
+        return name
+
+    def _sum(self, products):
+        """Value of a sum of products of values. The constant factors
+        are folded, and a variable is assigned unless the sum is
+        constant.
+        """
+        constant = 0.0
+        terms = list()
+        for factors in products:
+            coefficient = 1.0
+            names = list()
+            for factor in factors:
+                if isinstance(factor, str): names.append(factor)
+                else: coefficient *= factor
+            if abs(coefficient) < _SourceWriter.epsilon: continue
+            if not names:
+                constant += coefficient
+                continue
+            term = '*'.join(names)
+            if coefficient == -1.0: term = '-' + term
+            elif coefficient != 1.0: term = repr(coefficient) + '*' + term
+            terms.append(term)
+        if not terms: return constant
+        if abs(constant) >= _SourceWriter.epsilon:
+            terms.append(repr(constant))
+        if len(terms) == 1 and '*' not in terms[0] and \
+                not terms[0].startswith('-'):
+            return terms[0]
+        return self._variable(' + '.join(terms).replace('+ -', '- '))
+
+def _prune(lines, result):
+    """Remove the assignments of variables which the result does not
+    depend on.
+    """
+    used = set(re.findall(r'\bv\d+\b', result))
+    kept = list()
+    for line in reversed(lines):
+        name, expression = line.strip().split(' = ', 1)
+        if not name.startswith('v') or name in used:
+            used.update(re.findall(r'\bv\d+\b', expression))
+            kept.append(line)
+    return kept[::-1]
+
+def _tuple(values):
+    """Source of a tuple of values"""
+    values = [x if isinstance(x, str) else repr(float(x)) for x in values]
+    return '(' + ', '.join(values) + ',)'
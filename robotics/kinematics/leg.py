@@ -8,22 +8,52 @@ from robotics.lookup import *
 class Leg:
     """Multipod leg"""
 
-    def __init__(self, initial_displacement = None):
-        """Constructor"""
+    joints = ('root_coxa_joint', 'coxa_femur_joint', 'femur_tibia_joint')
+
+    # Geometry
+    coxa_length = 0.25
+    femur_length = 1.0
+    tibia_length = 2.0
+    femur_mount_angle = tau / 8
+    tibia_mount_angle = -tau / 4
+
+    def __init__(self, initial_displacement = None, cache_directory = None):
+        """Constructor. The generated forward kinematics source is cached
+        in the cache directory, if set.
+        """
         if initial_displacement == None:
-            self._initialize_tree(Displacement())
-        else:
-            self._initialize_tree(initial_displacement)
+            initial_displacement = Displacement()
+        self._initialize_tree(initial_displacement, cache_directory)
         self._joints_angles = np.asfarray([0] * 3)
         self._endpoint = self.endpoint(self._joints_angles)
         self._default_endpoint = self._endpoint
         self._rotation = initial_displacement.rotation.inverse()
 
+    def reset(self, joints_angles = None):
+        """Return to the default joints angles, or set the joints angles"""
+        if joints_angles is None:
+            self._joints_angles = np.asfarray([0] * 3)
+            self._endpoint = self._default_endpoint
+        else:
+            self._joints_angles = np.array(joints_angles, np.float_)
+            self._endpoint = self.endpoint(self._joints_angles)
+
     def endpoint(self, joints_angles):
         """Forward kinematics equation of the tree endpoint"""
-        parameters = self._prepare_parameters(joints_angles)
-        displacements = self._tree.evaluate(parameters)
-        return displacements['tibia'].translation
+        return self._endpoint_function(joints_angles)
+
+    def endpoints(self, joints_angles):
+        """Forward kinematics equation of the tree endpoint for a
+        (N, 3) array of joints angles. Returns a (N, 3) array.
+        """
+        _, translations = self._compiled_tree.evaluate_many(joints_angles)
+        return translations[:, self._compiled_tree.index('tibia')]
+
+    def endpoints_jacobian(self, joints_angles):
+        """Jacobian matrices of the endpoint for a (N, 3) array of joints
+        angles. Returns a (N, 3, 3) array.
+        """
+        return self._compiled_tree.jacobian_many(joints_angles, ['tibia'])
 
     def initialize_draw(self):
         """Initialize the visual elements"""
@@ -38,7 +68,7 @@ class Leg:
         parameters = self._prepare_parameters(self._joints_angles)
         self._tree.draw(parameters)
 
-    def _initialize_tree(self, initial_displacement):
+    def _initialize_tree(self, initial_displacement, cache_directory):
         """Initialize the kinematic tree"""
         self._tree = Tree(initial_displacement)
         self._tree.add_node(
@@ -48,23 +78,23 @@ class Leg:
                     mount_angle = 0))
         self._tree.add_node(
                 key = 'coxa',
-                part = RigidLink(0.25),
+                part = RigidLink(Leg.coxa_length),
                 parent = 'root_coxa_joint')
         self._tree.add_node(
                 key = 'coxa_femur_joint',
                 part = RevoluteJoint(
                     axis = [0, 1, 0],
-                    mount_angle = tau / 8),
+                    mount_angle = Leg.femur_mount_angle),
                 parent = 'coxa')
         self._tree.add_node(
                 key = 'femur',
-                part = RigidLink(1),
+                part = RigidLink(Leg.femur_length),
                 parent = 'coxa_femur_joint')
         self._tree.add_node(
                 key = 'femur_tibia_joint',
                 part = RevoluteJoint(
                     axis = [0, 1, 0],
-                    mount_angle = -tau / 4),
+                    mount_angle = Leg.tibia_mount_angle),
                 parent = 'femur')
         self._tree.add_node(
                 key = 'decoration',
@@ -72,15 +102,19 @@ class Leg:
                 parent = 'femur')
         self._tree.add_node(
                 key = 'tibia',
-                part = RigidLink(2),
+                part = RigidLink(Leg.tibia_length),
                 parent = 'femur_tibia_joint')
+        self._compiled_tree = self._tree.compile(
+                joints = Leg.joints, incremental = True)
+        self._endpoint_function, self._endpoint_jacobian = \
+                self._compiled_tree.generate(['tibia'], jacobian = True,
+                    cache_directory = cache_directory)
 
     def _prepare_parameters(self, joints_angles):
         """Prepare tree parameters from joints angles"""
         parameters = self._tree.prepare_parameters()
-        parameters['root_coxa_joint']['angle'] = joints_angles[0]
-        parameters['coxa_femur_joint']['angle'] = joints_angles[1]
-        parameters['femur_tibia_joint']['angle'] = joints_angles[2]
+        for key, angle in zip(Leg.joints, joints_angles):
+            parameters[key]['angle'] = angle
         return parameters
 
 class JacobianSolverLeg(Leg):
@@ -103,14 +137,31 @@ class JacobianSolverLeg(Leg):
                 output_vector = self._endpoint)
         self._endpoint = self.endpoint(self._joints_angles)
 
+    def solve_endpoint_inverse_kinematics(self, target_offset, **kwargs):
+        """Update the joints angles by iterating the IK solver until
+        the endpoint converges toward a set endpoint position. The
+        keyword arguments are the solve tolerances and iterations
+        budget. Returns the SolverResult.
+        """
+        target_endpoint = self._default_endpoint + target_offset
+        result = self._solver.solve(
+                input_vector = self._joints_angles,
+                target_output_vector = target_endpoint,
+                output_vector = self._endpoint,
+                **kwargs)
+        self._joints_angles = result.input_vector
+        self._endpoint = result.output_vector
+        return result
+
 class JacobianInverseSolverLeg(JacobianSolverLeg):
     """Leg solving inverse kinematics using the Jacobian inverse"""
 
     def __init__(self, **kwargs):
         """Constructor"""
-        JacobianLeg.__init__(self, **kwargs)
+        JacobianSolverLeg.__init__(self, **kwargs)
         self._solver = JacobianInverseSolver(
                 function = lambda x: self.endpoint(x),
+                jacobian = self._endpoint_jacobian,
                 max_input_fix = 0.5)
 
 class DampedLeastSquaresSolverLeg(JacobianSolverLeg):
@@ -118,35 +169,221 @@ class DampedLeastSquaresSolverLeg(JacobianSolverLeg):
 
     def __init__(self, **kwargs):
         """Constructor"""
-        JacobianLeg.__init__(self, **kwargs)
+        JacobianSolverLeg.__init__(self, **kwargs)
         self._solver = DampedLeastSquaresSolver(
                 function = lambda x: self.endpoint(x),
+                jacobian = self._endpoint_jacobian,
                 constant = 0.8)
 
-class LookupTableLeg(Leg):
-    """Leg solving inverse kinematics using a lookup table"""
+class BroydenSolverLeg(JacobianSolverLeg):
+    """Leg solving inverse kinematics using damped least squares with
+    Broyden updates of the Jacobian matrix. Tracking a moving target
+    usually costs a single forward kinematics evaluation per step.
+    """
 
-    def __init__(self, lookup_table, initial_displacement = None):
+    def __init__(self, **kwargs):
         """Constructor"""
-        Leg.__init__(self, initial_displacement = initial_displacement)
+        JacobianSolverLeg.__init__(self, **kwargs)
+        self._solver = BroydenSolver(
+                function = lambda x: self.endpoint(x),
+                constant = 0.8)
+
+class AnalyticSolverLeg(Leg):
+    """Leg solving inverse kinematics in closed form. In the leg frame
+    the coxa joint angle points the leg toward the target, and the femur
+    and tibia form a triangle in the vertical plane solved by the law of
+    cosines. The target is exactly reached in constant time whenever it
+    is within reach.
+    """
+
+    def __init__(self, initial_displacement = None, elbow_up = True,
+            cache_directory = None):
+        """Constructor. The elbow selects which of the two femur and
+        tibia configurations reaching a target is used. The default
+        configuration has the femur tibia joint above the endpoint.
+        """
+        Leg.__init__(self, initial_displacement = initial_displacement,
+                cache_directory = cache_directory)
+        self._elbow_up = elbow_up
+        self._default_local_endpoint = \
+                AnalyticSolverLeg.forward_kinematics(np.zeros((1, 3)))[0]
+
+    def endpoint_inverse_kinematics(self, target_offset):
+        """Update the joints angles to reach a set endpoint position, or
+        to get as close as possible if it is out of reach.
+        """
+        local_endpoint = self._default_local_endpoint + \
+                self._rotation.rotate(target_offset)
+        joints_angles, _ = AnalyticSolverLeg.inverse_kinematics(
+                [local_endpoint], elbow_up = self._elbow_up)
+        self._joints_angles = joints_angles[0]
+        self._endpoint = self.endpoint(self._joints_angles)
+
+    @staticmethod
+    def forward_kinematics(joints_angles):
+        """Endpoints in the leg frame for a (N, 3) array of joints
+        angles. Returns a (N, 3) array.
+        """
+        joints_angles = np.asfarray(joints_angles)
+        femur_angles = joints_angles[:, 1] + Leg.femur_mount_angle
+        tibia_angles = femur_angles + joints_angles[:, 2] + \
+                Leg.tibia_mount_angle
+        radii = Leg.coxa_length + Leg.femur_length * np.cos(femur_angles) + \
+                Leg.tibia_length * np.cos(tibia_angles)
+        heights = Leg.femur_length * np.sin(femur_angles) + \
+                Leg.tibia_length * np.sin(tibia_angles)
+        return np.column_stack((
+                radii * np.cos(joints_angles[:, 0]),
+                radii * np.sin(joints_angles[:, 0]),
+                -heights))
+
+    @staticmethod
+    def inverse_kinematics(local_endpoints, elbow_up = True):
+        """Joints angles reaching a (N, 3) array of endpoints in the leg
+        frame. Returns a (N, 3) array of joints angles and an array of
+        booleans which are False where the endpoint is out of reach, in
+        which case the leg points toward it as closely as possible.
+        """
+        local_endpoints = np.asfarray(local_endpoints)
+        x, y, z = np.transpose(local_endpoints)
+        coxa_angles = np.arctan2(y, x)
+        # Femur and tibia triangle in the vertical plane of the leg
+        u = np.hypot(x, y) - Leg.coxa_length
+        v = -z
+        distances_squared = u * u + v * v
+        cosines = (distances_squared - Leg.femur_length**2 -
+                Leg.tibia_length**2) / \
+                (2 * Leg.femur_length * Leg.tibia_length)
+        reachable = np.abs(cosines) <= 1
+        tibia_angles = np.arccos(np.clip(cosines, -1, 1))
+        if elbow_up: tibia_angles = -tibia_angles
+        femur_angles = np.arctan2(v, u) - np.arctan2(
+                Leg.tibia_length * np.sin(tibia_angles),
+                Leg.femur_length + Leg.tibia_length * np.cos(tibia_angles))
+        joints_angles = np.column_stack((
+                coxa_angles,
+                femur_angles - Leg.femur_mount_angle,
+                tibia_angles - Leg.tibia_mount_angle))
+        # Wrap the angles around the default joints angles
+        joints_angles = np.arctan2(
+                np.sin(joints_angles), np.cos(joints_angles))
+        return joints_angles, reachable
+
+class LookupTableLeg(Leg):
+    """Leg solving inverse kinematics using a lookup table. The joints
+    angles interpolated from the lookup table may optionally be refined
+    toward the exact target by a few damped least squares iterations,
+    so that a coarse lookup table is enough for an accurate result.
+    """
+
+    def __init__(self, lookup_table, initial_displacement = None,
+            refine_iterations = 0,
+            tolerance = 1e-4,
+            cache_directory = None):
+        """Constructor. The refinement stops after the set number of
+        iterations or once the endpoint is within the tolerance of the
+        target.
+        """
+        Leg.__init__(self, initial_displacement = initial_displacement,
+                cache_directory = cache_directory)
         self._lookup_table = lookup_table
+        self._refine_iterations = int(refine_iterations)
+        self._tolerance = float(tolerance)
+        self._solver = None
+        if self._refine_iterations > 0:
+            self._solver = DampedLeastSquaresSolver(
+                    function = lambda x: self.endpoint(x),
+                    jacobian = self._endpoint_jacobian,
+                    constant = 0.1)
 
     def endpoint_inverse_kinematics(self, target_offset):
         """Update the joints angles to reach a set endpoint position
-        according to the lookup table.
+        according to the lookup table, then refine them if enabled.
         """
         input_vector = self._rotation.rotate(target_offset)
         self._joints_angles = self._lookup_table.get_lerp(input_vector)
         self._endpoint = self.endpoint(self._joints_angles)
+        if self._solver is not None:
+            result = self._solver.solve(
+                    input_vector = self._joints_angles,
+                    target_output_vector = self._default_endpoint + \
+                        target_offset,
+                    output_vector = self._endpoint,
+                    max_iterations = self._refine_iterations,
+                    output_tolerance = self._tolerance)
+            self._joints_angles = result.input_vector
+            self._endpoint = result.output_vector
+
+    @staticmethod
+    def fingerprint():
+        """Identifies the leg geometry and the populate method, so that
+        lookup tables populated for another leg are detected.
+        """
+        return 'dls-solve:' + Leg()._compiled_tree.fingerprint()
 
     @staticmethod
-    def populate(lookup_table):
+    def populate(lookup_table, processes = None, **kwargs):
         """Populate the lookup table using damped least squares
-        iterations.
+        iterations, optionally split across a pool of processes. Other
+        keyword arguments are passed to the populate method of the lookup
+        table, e.g. the maximum error of an AdaptiveLookupTable.
+        """
+        return lookup_table.populate(
+                function = _populate_lookup_table_leg,
+                batched = True,
+                processes = processes,
+                **kwargs)
+
+    @staticmethod
+    def populate_continuation(lookup_table,
+            tolerance = 1e-3,
+            max_iterations = 50):
+        """Populate the lookup table using damped least squares solves
+        along a path through adjacent points of the grid. Each point is
+        warm-started from the joints angles solved at the previous
+        point, and solved until the endpoint is within the tolerance of
+        the target, the joints angles stop moving, or the maximum
+        number of iterations is reached.
+
+        Returns the grid of the final endpoint errors, which exceed the
+        tolerance where the solver did not converge, and the total
+        number of iterations.
         """
-        def f(input_vector):
-            leg = DampedLeastSquaresSolverLeg()
-            for _ in xrange(10):
-                leg.endpoint_inverse_kinematics(input_vector)
+        leg = DampedLeastSquaresSolverLeg()
+        errors = list()
+        iterations = [0]
+        def f(input_vector, seed):
+            leg.reset(seed)
+            result = leg.solve_endpoint_inverse_kinematics(input_vector,
+                    max_iterations = max_iterations,
+                    output_tolerance = tolerance,
+                    input_tolerance = _populate_input_tolerance)
+            iterations[0] += result.iterations
+            errors.append(result.error)
             return leg._joints_angles
-        lookup_table.populate(function = f)
+        input_indices = lookup_table.populate_continuation(function = f)
+        errors_grid = np.empty(lookup_table._input_points)
+        errors_grid[tuple(np.transpose(input_indices))] = errors
+        return errors_grid, iterations[0]
+
+# Joints angles fix (radians) below which lookup table solves stop
+_populate_input_tolerance = 1e-4
+
+def _populate_lookup_table_leg(input_vectors):
+    """Solve the joints angles for a batch of lookup table inputs as
+    independent problems of a batched damped least squares solver,
+    starting from the default joints angles. Defined at the top level
+    so that it can be sent to worker processes.
+    """
+    leg = Leg()
+    solver = BatchDampedLeastSquaresSolver(
+            function = leg.endpoints,
+            jacobian = leg.endpoints_jacobian,
+            constant = 0.8)
+    result = solver.solve(
+            input_vectors = np.zeros((len(input_vectors), 3)),
+            target_output_vectors = leg._default_endpoint + input_vectors,
+            max_iterations = 50,
+            output_tolerance = 1e-4,
+            input_tolerance = _populate_input_tolerance)
+    return result.input_vector
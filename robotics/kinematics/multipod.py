@@ -0,0 +1,75 @@
+from robotics.kinematics.leg import *
+
+class Multipod:
+    """Multipod body with legs solving inverse kinematics using a shared
+    lookup table. The legs mounts are stored as stacked arrays so that
+    the leg frames, lookup table queries and forward kinematics of all
+    the legs are computed in a single vectorized pass.
+    """
+
+    def __init__(self, mount_displacements, lookup_table,
+            cache_directory = None):
+        """Constructor. The mount displacements are a displacement array
+        with one displacement per leg, relative to the body. The legs
+        cache their generated forward kinematics source in the cache
+        directory, if set.
+        """
+        self._mounts = mount_displacements.copy()
+        self._inverse_rotations = self._mounts.rotations.inverse()
+        self._lookup_table = lookup_table
+        self._legs = [LookupTableLeg(
+                initial_displacement = self._mounts[i],
+                lookup_table = lookup_table,
+                cache_directory = cache_directory)
+                for i in xrange(len(self._mounts))]
+        # Leg without a mount, evaluating the endpoints of all the legs
+        self._local_leg = Leg(cache_directory = cache_directory)
+        self._joints_angles = np.zeros((len(self._legs), 3))
+        self._default_endpoints = self._world_endpoints(self._joints_angles)
+        self._endpoints = self._default_endpoints
+
+    def __len__(self):
+        """Number of legs"""
+        return len(self._legs)
+
+    def joints_angles(self):
+        """(legs, 3) array of the joints angles"""
+        return self._joints_angles
+
+    def endpoints(self):
+        """(legs, 3) array of the endpoints in the body frame"""
+        return self._endpoints
+
+    def endpoints_inverse_kinematics(self, target_offsets):
+        """Update the joints angles of all the legs to reach set endpoint
+        positions according to the lookup table. The target offsets are
+        in the body frame, either a single offset shared by all the legs
+        or a (legs, 3) array with one offset per leg.
+        """
+        input_vectors = self._inverse_rotations.rotate(target_offsets)
+        self._joints_angles = self._lookup_table.get_lerp_many(input_vectors)
+        self._endpoints = self._world_endpoints(self._joints_angles)
+
+    def initialize_draw(self):
+        """Initialize the visual elements"""
+        for leg in self._legs:
+            leg.initialize_draw()
+
+    def uninitialize_draw(self):
+        """Delete the visual elements"""
+        for leg in self._legs:
+            leg.uninitialize_draw()
+
+    def draw(self):
+        """Render the visual elements"""
+        for leg, joints_angles in zip(self._legs, self._joints_angles):
+            leg.reset(joints_angles)
+            leg.draw()
+
+    def _world_endpoints(self, joints_angles):
+        """Endpoints in the body frame for a (legs, 3) array of joints
+        angles, using the compiled kinematic tree of the legs.
+        """
+        local_endpoints = self._local_leg.endpoints(joints_angles)
+        return self._mounts.translations + \
+                self._mounts.rotations.rotate(local_endpoints)
@@ -1,8 +1,12 @@
 import numpy as np
 import collections
+import hashlib
+import os
+import tempfile
 from visual import *
 
 from robotics.displacement import *
+from robotics.kinematics.codegen import *
 
 class Tree:
     """Kinematic tree. Can be used as a kinematic chain.
@@ -52,6 +56,15 @@ class Tree:
                 todo.append(child_key)
         return displacements
 
+    def compile(self, joints, incremental = False):
+        """Freeze the current topology into a compiled tree evaluated
+        from a joints angles vector. The joints are the keys of the
+        revolute joints nodes, in the order of the vector components.
+        An incremental compiled tree only re-evaluates the subtrees
+        downstream of the joints whose angles changed.
+        """
+        return CompiledTree(self, joints, incremental = incremental)
+
     def initialize_draw(self):
         """Initialize the visual parts"""
         for key in self._parts:
@@ -73,6 +86,370 @@ class Tree:
                 displacement_after = displacements[key]
                 self._parts[key].draw(displacement_before, displacement_after)
 
+class CompiledTree:
+    """Kinematic tree with a frozen topology.
+
+    The nodes are stored in depth-first order so that each parent comes
+    before its children, and the parents are referenced by index. Each
+    evaluation writes the world rotation matrix and translation of the
+    nodes into preallocated buffers.
+
+    The chains of constant displacements (root, rigid links and joints
+    mount angles) are folded once and for all into a fixed displacement
+    of each node relative to its anchor, the nearest upstream joint or
+    the world. Evaluating a joint is then a fixed displacement times a
+    rotation around its axis, which only needs the sine and cosine of
+    its angle. The other nodes are composed from their anchor when they
+    are accessed.
+
+    Since the order is depth-first, the subtree of each node is a
+    contiguous range of nodes. In incremental mode the buffers act as a
+    cache and only the subtrees of the modified joints are evaluated.
+    """
+
+    def __init__(self, tree, joints, incremental = False):
+        """Constructor"""
+        self._keys = list()
+        todo = ['root']
+        while todo:
+            key = todo.pop()
+            self._keys.append(key)
+            todo.extend(reversed(tree._children[key]))
+        self._indices = dict((key, i) for i, key in enumerate(self._keys))
+        size = len(self._keys)
+        self._parents = np.array(
+                [-1] + [self._indices[tree._parents[key]]
+                    for key in self._keys[1:]], np.int_)
+        self._subtrees_ends = np.arange(1, size + 1)
+        for i in reversed(xrange(1, size)):
+            parent = self._parents[i]
+            self._subtrees_ends[parent] = max(
+                    self._subtrees_ends[parent], self._subtrees_ends[i])
+        # Joints
+        self._joints_slots = -np.ones(size, np.int_)
+        for slot, key in enumerate(joints):
+            if not isinstance(tree._parts[key], RevoluteJoint):
+                raise ValueError('Node "' + key + '" is not a revolute joint')
+            self._joints_slots[self._indices[key]] = slot
+        self._joints_count = len(joints)
+        self._joints_indices = np.array(
+                [self._indices[key] for key in joints], np.int_)
+        # Joints strictly upstream of each node
+        self._joints_ancestry = np.zeros((size, len(joints)), np.bool_)
+        for i in xrange(1, size):
+            parent = self._parents[i]
+            self._joints_ancestry[i] = self._joints_ancestry[parent]
+            if self._joints_slots[parent] >= 0:
+                self._joints_ancestry[i, self._joints_slots[parent]] = True
+        # Local displacements, constant unless the node is a joint
+        self._local_rotations = np.empty((size, 3, 3), np.float_)
+        self._local_translations = np.zeros((size, 3), np.float_)
+        self._axes = np.zeros((size, 3), np.float_)
+        self._mount_angles = np.zeros(size, np.float_)
+        for i, key in enumerate(self._keys):
+            part = tree._parts[key]
+            if self._joints_slots[i] >= 0:
+                self._axes[i] = part._axis / np.linalg.norm(part._axis)
+                self._mount_angles[i] = part._mount_angle
+                self._local_rotations[i] = Rotation.axis_angle(
+                        self._axes[i], part._mount_angle)._matrix
+            else:
+                displacement = part.displacement()
+                self._local_rotations[i] = displacement.rotation._matrix
+                self._local_translations[i] = displacement.translation
+        self._fold()
+        # World displacements. The nodes anchored to the world are
+        # constant, except for the joints.
+        self._rotations = self._fixed_rotations.copy()
+        self._translations = self._fixed_translations.copy()
+        self._stale = np.zeros(size, np.bool_)
+        self._incremental = incremental
+        self._evaluated_angles = None
+
+    def _fold(self):
+        """Fold the constant local displacements into the fixed
+        displacement of each node relative to its anchor. The fixed
+        rotation of a joint includes its mount angle, and is stored with
+        the products of the fixed rotation by the cross and outer product
+        matrices of the joint axis, used by the Rodrigues formula.
+        """
+        size = len(self._keys)
+        self._anchors = -np.ones(size, np.int_)
+        self._fixed_rotations = self._local_rotations.copy()
+        self._fixed_translations = self._local_translations.copy()
+        for i in xrange(1, size):
+            parent = self._parents[i]
+            if self._joints_slots[parent] >= 0:
+                self._anchors[i] = parent
+                continue
+            self._anchors[i] = self._anchors[parent]
+            parent_rotation = self._fixed_rotations[parent]
+            self._fixed_rotations[i] = np.dot(
+                    parent_rotation, self._local_rotations[i])
+            self._fixed_translations[i] = self._fixed_translations[parent] + \
+                    np.dot(parent_rotation, self._local_translations[i])
+        axes_cross, axes_outer = RotationArray._axes_matrices(self._axes)
+        self._fixed_cross = np.matmul(self._fixed_rotations, axes_cross)
+        self._fixed_outer = np.matmul(self._fixed_rotations, axes_outer)
+        is_joint = self._joints_slots >= 0
+        self._folded_joints = np.flatnonzero(is_joint)
+        self._anchored = (self._anchors >= 0) & ~is_joint
+
+    def index(self, key):
+        """Index of a node in the evaluation buffers"""
+        return self._indices[key]
+
+    def fingerprint(self):
+        """Hash of the topology, geometry and joints of the tree"""
+        sha1 = hashlib.sha1()
+        constant = self._joints_slots < 0
+        for array in (self._parents, self._joints_slots,
+                self._local_rotations[constant], self._local_translations,
+                self._axes, self._mount_angles):
+            sha1.update(np.ascontiguousarray(array).tobytes())
+        return sha1.hexdigest()
+
+    def evaluate(self, joints_angles):
+        """Evaluate the world displacement of each node using forward
+        kinematics. The results are written into the buffers returned
+        by rotation_matrix and translation.
+        """
+        joints_angles = np.asfarray(joints_angles)
+        if len(joints_angles) != self._joints_count:
+            raise ValueError('Expected ' + str(self._joints_count) +
+                    ' joints angles')
+        rotations = self._rotations
+        translations = self._translations
+        if self._evaluated_angles is None:
+            joints = self._folded_joints
+            self._stale |= self._anchored
+        else:
+            changed = np.flatnonzero(joints_angles != self._evaluated_angles)
+            if len(changed) == 0: return
+            dirty = np.zeros(len(self._keys), np.bool_)
+            for i in self._joints_indices[changed]:
+                dirty[i:self._subtrees_ends[i]] = True
+            joints = self._folded_joints[dirty[self._folded_joints]]
+            self._stale |= dirty & self._anchored
+        if self._incremental:
+            self._evaluated_angles = joints_angles.copy()
+        angles = joints_angles[self._joints_slots[joints]]
+        cosines = np.cos(angles)
+        sines = np.sin(angles)
+        for i, cos, sin in zip(joints, cosines, sines):
+            rotation = cos * self._fixed_rotations[i] + \
+                    sin * self._fixed_cross[i] + \
+                    (1 - cos) * self._fixed_outer[i]
+            anchor = self._anchors[i]
+            if anchor < 0:
+                rotations[i] = rotation
+                continue
+            np.dot(rotations[anchor], rotation, rotations[i])
+            np.dot(rotations[anchor], self._fixed_translations[i],
+                    translations[i])
+            translations[i] += translations[anchor]
+
+    def _refresh(self, i):
+        """Compose a node which is not a joint from its anchor, if it
+        was not since the last evaluation.
+        """
+        if not self._stale[i]: return
+        anchor = self._anchors[i]
+        np.dot(self._rotations[anchor], self._fixed_rotations[i],
+                self._rotations[i])
+        np.dot(self._rotations[anchor], self._fixed_translations[i],
+                self._translations[i])
+        self._translations[i] += self._translations[anchor]
+        self._stale[i] = False
+
+    def jacobian(self, endpoints):
+        """Positional Jacobian matrix of the endpoints translations with
+        respect to the joints angles as of the last evaluation. The rows
+        are the stacked endpoints translations components.
+        """
+        matrix = np.zeros((3 * len(endpoints), self._joints_count))
+        joints_indices = np.flatnonzero(self._joints_slots >= 0)
+        joints_slots = self._joints_slots[joints_indices]
+        # The world axis of a joint is the same before and after its
+        # own rotation.
+        axes = np.matmul(self._rotations[joints_indices],
+                self._axes[joints_indices][..., np.newaxis])[..., 0]
+        for k, key in enumerate(endpoints):
+            i = self._indices[key]
+            self._refresh(i)
+            mask = self._joints_ancestry[i, joints_slots]
+            arms = self._translations[i] - \
+                    self._translations[joints_indices[mask]]
+            matrix[3 * k:3 * k + 3, joints_slots[mask]] = np.transpose(
+                    np.cross(axes[mask], arms))
+        return matrix
+
+    def dependency_mask(self, endpoints):
+        """Boolean matrix shaped as the positional Jacobian matrix of the
+        endpoints which is True where a translation component may depend
+        on a joint angle, that is where the joint is upstream of the
+        endpoint.
+        """
+        indices = [self._indices[key] for key in endpoints]
+        return np.repeat(self._joints_ancestry[indices], 3, axis = 0)
+
+    def jacobian_function(self, endpoints):
+        """Analytic Jacobian provider for the Jacobian solvers. Maps a
+        joints angles vector to the positional Jacobian matrix of the
+        endpoints.
+        """
+        def f(joints_angles):
+            self.evaluate(joints_angles)
+            return self.jacobian(endpoints)
+        return f
+
+    def generate(self, endpoints, jacobian = False, cache_directory = None):
+        """Generate a forward kinematics function specialized for this
+        tree, mapping a joints angles vector to the stacked translations
+        of the endpoints. If jacobian is set, also generate the function
+        mapping it to their positional Jacobian matrix, and return both.
+
+        The generated module is cached in memory, and as a source file in
+        the cache directory if one is set, so that later startups skip
+        the generation. The cache key covers the tree and the version of
+        the generator, and the source file is written atomically so that
+        concurrent startups never read a partial one.
+        """
+        key = hashlib.sha1(generator_fingerprint() + self.fingerprint() +
+                repr((
+                [self._indices[endpoint] for endpoint in endpoints],
+                bool(jacobian)))).hexdigest()
+        namespace = _generated_modules.get(key)
+        if namespace is None:
+            filename = '<generated ' + key + '>'
+            source = None
+            if cache_directory is not None:
+                filename = os.path.join(cache_directory, 'tree_' + key + '.py')
+                if os.path.isfile(filename):
+                    with open(filename) as source_file:
+                        source = source_file.read()
+            if source is None:
+                source = generate_source(self, endpoints, jacobian)
+                if cache_directory is not None:
+                    _write_atomically(filename, source)
+            namespace = compile_source(source, filename)
+            _generated_modules[key] = namespace
+        if jacobian: return namespace['endpoints'], namespace['jacobian']
+        return namespace['endpoints']
+
+    def evaluate_many(self, joints_angles):
+        """Evaluate the world displacement of each node for a (N, J)
+        array of joints angles in a single vectorized pass. Returns a
+        (N, nodes, 3, 3) array of rotation matrices and a (N, nodes, 3)
+        array of translations, indexed by node as per index.
+        """
+        joints_angles = np.asfarray(joints_angles)
+        if joints_angles.ndim != 2 or \
+                joints_angles.shape[1] != self._joints_count:
+            raise ValueError('Expected a (N, ' + str(self._joints_count) +
+                    ') array of joints angles')
+        count = len(joints_angles)
+        size = len(self._keys)
+        rotations = np.empty((count, size, 3, 3), np.float_)
+        translations = np.empty((count, size, 3), np.float_)
+        rotations[:] = self._fixed_rotations
+        translations[:] = self._fixed_translations
+        for i in xrange(1, size):
+            anchor = self._anchors[i]
+            slot = self._joints_slots[i]
+            if slot >= 0:
+                angles = joints_angles[:, slot, np.newaxis, np.newaxis]
+                cosines = np.cos(angles)
+                fixed_rotations = cosines * self._fixed_rotations[i] + \
+                        np.sin(angles) * self._fixed_cross[i] + \
+                        (1 - cosines) * self._fixed_outer[i]
+            elif anchor >= 0:
+                fixed_rotations = self._fixed_rotations[i]
+            else:
+                continue
+            if anchor < 0:
+                rotations[:, i] = fixed_rotations
+                continue
+            anchor_rotations = rotations[:, anchor]
+            if slot >= 0:
+                rotations[:, i] = np.matmul(anchor_rotations, fixed_rotations)
+            else:
+                rotations[:, i] = np.dot(anchor_rotations, fixed_rotations)
+            translations[:, i] = translations[:, anchor] + np.dot(
+                    anchor_rotations, self._fixed_translations[i])
+        return rotations, translations
+
+    def jacobian_many(self, joints_angles, endpoints):
+        """Positional Jacobian matrices of the endpoints translations for
+        a (N, J) array of joints angles. Returns a (N, 3 * endpoints, J)
+        array.
+        """
+        rotations, translations = self.evaluate_many(joints_angles)
+        matrices = np.zeros((len(rotations), 3 * len(endpoints),
+                self._joints_count))
+        joints_indices = np.flatnonzero(self._joints_slots >= 0)
+        joints_slots = self._joints_slots[joints_indices]
+        axes = np.matmul(rotations[:, joints_indices],
+                self._axes[joints_indices][..., np.newaxis])[..., 0]
+        for k, key in enumerate(endpoints):
+            i = self._indices[key]
+            mask = self._joints_ancestry[i, joints_slots]
+            arms = translations[:, i, np.newaxis] - \
+                    translations[:, joints_indices[mask]]
+            matrices[:, 3 * k:3 * k + 3, joints_slots[mask]] = np.transpose(
+                    np.cross(axes[:, mask], arms), (0, 2, 1))
+        return matrices
+
+    def rotation_matrix(self, key):
+        """World rotation matrix of a node as of the last evaluation.
+        This is a view on the evaluation buffers, which is only up to
+        date until the next evaluation.
+        """
+        i = self._indices[key]
+        self._refresh(i)
+        return self._rotations[i]
+
+    def translation(self, key):
+        """World translation of a node as of the last evaluation. This
+        is a view on the evaluation buffers, which is only up to date
+        until the next evaluation.
+        """
+        i = self._indices[key]
+        self._refresh(i)
+        return self._translations[i]
+
+    def displacement(self, key):
+        """World displacement of a node as of the last evaluation"""
+        return Displacement(
+                translation = self.translation(key),
+                rotation = Rotation._from_matrix(self.rotation_matrix(key)))
+
+    def displacement_into(self, key, out):
+        """Writes the world displacement of a node as of the last
+        evaluation into an existing displacement.
+        """
+        out.translation[...] = self.translation(key)
+        out.rotation._matrix[...] = self.rotation_matrix(key)
+
+# Generated modules by key of the tree and endpoints
+_generated_modules = dict()
+
+def _write_atomically(filename, content):
+    """Write a file through a temporary file renamed over it"""
+    directory = os.path.dirname(filename)
+    try: os.makedirs(directory)
+    except OSError:
+        # Created concurrently
+        if not os.path.isdir(directory): raise
+    fd, temporary = tempfile.mkstemp(suffix = '.tmp', dir = directory)
+    try:
+        with os.fdopen(fd, 'w') as temporary_file:
+            temporary_file.write(content)
+        os.rename(temporary, filename)
+    except:
+        os.remove(temporary)
+        raise
+
 class RigidLink:
     """Rigid link part"""
 
@@ -1,16 +1,27 @@
 import numpy as np
+import multiprocessing
+import json
+import os.path
 
 class LookupTable:
     """Instances of this class associate output vectors to input
     vectors at the points of a uniform grid. We can then calculate the
     output vector at any input vector using nearest-neighbor or linear
     interpolation. The output and input vectors can have any size.
+
+    The output vectors may be stored with a smaller dtype, e.g. float32,
+    or an integer dtype such as int16 which maps each output component
+    linearly from its range. Interpolation is always done in float64.
     """
 
-    def __init__(self, input_specifications, output_size, epsilon = 1e-9):
+    def __init__(self, input_specifications, output_size, epsilon = 1e-9,
+            dtype = np.float64, output_ranges = None):
         """Constructor. Defines the bounds of the grid and the number
         of its points for each component of the input vector, and the
-        number of components of the output vector.
+        number of components of the output vector. With an integer
+        dtype, the range of each output component is either set by a
+        list of (from, to) pairs, or fitted to the output vectors when
+        the whole lookup table is populated.
         """
         # Input
         self._input_size = len(input_specifications)
@@ -18,49 +29,265 @@ class LookupTable:
                 tuple(float(x['from']) for x in input_specifications))
         self._input_to = np.array(
                 tuple(float(x['to']) for x in input_specifications))
-        self._input_points = np.array(
-                tuple(int(x['points']) for x in input_specifications))
         self._input_span = self._input_to - self._input_from
         # Output
         self._output_size = int(output_size)
+        self._dtype = np.dtype(dtype)
+        self._quantized = np.issubdtype(self._dtype, np.integer)
+        self._scale = None
+        self._offset = None
+        # Output ranges set by the caller are kept when populating
+        self._fit_output_ranges = output_ranges is None
+        if output_ranges is not None:
+            output_ranges = np.asfarray(output_ranges)
+            self._set_output_ranges(output_ranges[:, 0], output_ranges[:, 1])
         # Lookup table
-        shape = list(self._input_points)
-        shape.append(self._output_size)
-        self._table = np.zeros(shape)
+        self._resize(tuple(int(x['points']) for x in input_specifications))
         # Epsilon
         self._epsilon = float(epsilon)
 
-    def save(self, filename):
-        """Saves the lookup table data"""
-        np.save(filename, np.array(self._table))
+    def _resize(self, input_points):
+        """Sets the number of grid points of each component of the input
+        vector, and allocates an empty lookup table for them.
+        """
+        self._input_points = np.array(input_points, np.int_)
+        shape = list(self._input_points)
+        shape.append(self._output_size)
+        self._table = np.zeros(shape, self._dtype)
+        # Strides of the grid points in the flattened lookup table, and
+        # offsets of the hypercube corners relative to the lowest one
+        self._strides = np.ones(self._input_size, np.int_)
+        for i in reversed(xrange(self._input_size - 1)):
+            self._strides[i] = self._strides[i + 1] * self._input_points[i + 1]
+        self._corners = np.array(list(np.ndindex(*([2] * self._input_size))),
+                np.bool_).reshape(-1, self._input_size)
+        self._corners_offsets = np.dot(self._corners, self._strides)
+
+    def _set_output_ranges(self, output_from, output_to):
+        """Sets the range of each output component mapped to the integer
+        dtype.
+        """
+        if not self._quantized: return
+        maximum = np.iinfo(self._dtype).max
+        self._offset = (output_from + output_to) / 2.
+        self._scale = (output_to - output_from) / (2. * maximum)
+        self._scale[self._scale <= 0] = 1.
 
-    def load(self, filename):
-        """Loads the lookup table data"""
-        self._table = np.load(filename)
+    def save(self, filename, fingerprint = None, compressed = False):
+        """Saves the lookup table. The data is saved in a .npy file, or a
+        compressed .npz file, and the description of the grid in a .json
+        file next to it. The optional fingerprint identifies the source
+        of the data, e.g. the function used to populate the lookup
+        table.
+        """
+        data_filename, description_filename = LookupTable._filenames(filename)
+        compressed_filename = data_filename[:-len('.npy')] + '.npz'
+        if compressed:
+            np.savez_compressed(compressed_filename, table = self._table)
+            stale_filename = data_filename
+        else:
+            np.save(data_filename, np.ascontiguousarray(self._table))
+            stale_filename = compressed_filename
+        if os.path.isfile(stale_filename): os.remove(stale_filename)
+        with open(description_filename, 'w') as description_file:
+            json.dump(self._description(fingerprint), description_file,
+                    indent = 4, sort_keys = True)
 
-    def populate(self, function):
-        """Populates the lookup table at all the points of the grid"""
-        def f(input_indices):
-            input_vector = self._from_indices(input_indices)
-            self._set(input_indices, function(input_vector))
-        self._iterate_all(function = f)
+    def load(self, filename, mmap_mode = None, fingerprint = None):
+        """Loads the lookup table data. The saved description must match
+        the grid of this lookup table, and the fingerprint if one is
+        set, or a ValueError is raised. So must the output ranges, if
+        they were set by the caller. The data may be memory-mapped
+        using any of the numpy.load modes, so that processes can share
+        a single copy of large lookup tables. Compressed data is always
+        loaded in memory.
+        """
+        data_filename, description_filename = LookupTable._filenames(filename)
+        output_ranges = None
+        if os.path.isfile(description_filename):
+            with open(description_filename) as description_file:
+                description = json.load(description_file)
+            expected = self._description(fingerprint)
+            if fingerprint is None:
+                del description['fingerprint'], expected['fingerprint']
+            output_ranges = description.pop('output_ranges', None)
+            expected_ranges = expected.pop('output_ranges')
+            if description != expected:
+                raise ValueError('Lookup table "' + filename +
+                        '" does not match the expected description')
+            if not self._fit_output_ranges and \
+                    expected_ranges is not None and \
+                    (output_ranges is None or
+                        not np.allclose(expected_ranges, output_ranges)):
+                raise ValueError('Lookup table "' + filename +
+                        '" does not match the expected output ranges')
+        elif fingerprint is not None:
+            raise ValueError('Lookup table "' + filename +
+                    '" has no description')
+        compressed_filename = data_filename[:-len('.npy')] + '.npz'
+        if not os.path.isfile(data_filename) and \
+                os.path.isfile(compressed_filename):
+            with np.load(compressed_filename) as data:
+                table = data['table']
+        else:
+            table = np.load(data_filename, mmap_mode = mmap_mode)
+        if table.shape != self._table.shape or table.dtype != self._dtype:
+            raise ValueError('Lookup table "' + filename +
+                    '" does not match the expected shape')
+        if output_ranges is not None:
+            output_ranges = np.asfarray(output_ranges)
+            self._set_output_ranges(output_ranges[:, 0], output_ranges[:, 1])
+        self._table = table
+
+    @classmethod
+    def open(cls, filename, mmap_mode = None, dtype = None,
+            output_ranges = None):
+        """Creates a lookup table from a saved lookup table and its
+        description. The dtype and output ranges, if set, must match the
+        saved ones, or a ValueError is raised.
+        """
+        _, description_filename = LookupTable._filenames(filename)
+        with open(description_filename) as description_file:
+            description = json.load(description_file)
+        if dtype is None: dtype = np.dtype(str(description['dtype']))
+        lookup_table = cls(
+                input_specifications = description['input_specifications'],
+                output_size = description['output_size'],
+                dtype = dtype,
+                output_ranges = output_ranges)
+        lookup_table.load(filename, mmap_mode = mmap_mode)
+        return lookup_table
+
+    def populate(self, function, batched = False, processes = None,
+            chunk_size = None):
+        """Populates the lookup table at all the points of the grid.
+
+        A batched function maps a (N, input size) array of input vectors
+        to a (N, output size) array of output vectors. If a number of
+        processes is set the grid is split into chunks evaluated by a
+        pool of worker processes, in which case the function must be
+        picklable (e.g. defined at the top level of a module).
+        """
+        input_vectors = self._from_indices(self._grid_indices())
+        output_vectors = _evaluate(
+                function, input_vectors, batched, processes, chunk_size)
+        self._table.reshape(-1, self._output_size)[:] = self._quantize(
+                output_vectors, fit = self._fit_output_ranges)
+
+    def populate_continuation(self, function):
+        """Populates the lookup table along a path through adjacent
+        points of the grid. The function is called with an input vector
+        and a seed, which is the output vector at the previous point of
+        the path (None for the first point), e.g. to warm-start an
+        iterative solver. Returns the (points, input size) array of the
+        grid indices in the order of the path.
+        """
+        input_indices = self._serpentine_indices()
+        input_vectors = self._from_indices(input_indices)
+        offsets = np.dot(input_indices, self._strides)
+        output_vectors = np.empty((len(offsets), self._output_size))
+        seed = None
+        for i, input_vector in enumerate(input_vectors):
+            seed = np.asfarray(function(input_vector, seed))
+            output_vectors[i] = seed
+        self._table.reshape(-1, self._output_size)[offsets] = \
+                self._quantize(output_vectors,
+                    fit = self._fit_output_ranges)
+        return input_indices
 
     def get_nearest(self, input_vector):
         """Estimates the output vector using nearest-neighbor interpolation"""
-        input_indices = self._to_indices(input_vector)
-        input_indices = np.round(input_indices)
-        return self._get(input_indices)
+        return self.get_nearest_many([input_vector])[0]
 
     def get_lerp(self, input_vector):
         """Estimates the output vector using linear interpolation"""
-        input_indices = self._to_indices(input_vector)
-        first_corner = np.floor(input_indices)
-        weights = list()
-        def f(input_indices):
-            weights.append(self._get(input_indices))
-        self._iterate_hypercube(function = f, input_indices = first_corner)
-        distances = list(reversed(input_indices - first_corner))
-        return LookupTable._process_lerp(weights, distances)
+        return self.get_lerp_many([input_vector])[0]
+
+    def get_simplex(self, input_vector):
+        """Estimates the output vector using simplex interpolation"""
+        return self.get_simplex_many([input_vector])[0]
+
+    def get_nearest_many(self, input_vectors):
+        """Estimates the output vectors of a (N, input size) array of
+        input vectors using nearest-neighbor interpolation. Returns a
+        (N, output size) array.
+        """
+        input_indices = self._to_indices(input_vectors)
+        input_indices = np.round(input_indices).astype(np.int_)
+        return self._get_many(np.dot(input_indices, self._strides))
+
+    def get_lerp_many(self, input_vectors):
+        """Estimates the output vectors of a (N, input size) array of
+        input vectors using linear interpolation. Returns a (N, output
+        size) array.
+        """
+        input_indices = self._to_indices(input_vectors)
+        first_corners = np.floor(input_indices)
+        distances = (input_indices - first_corners)[:, np.newaxis, :]
+        first_offsets = np.dot(first_corners.astype(np.int_), self._strides)
+        values = self._get_many(
+                first_offsets[:, np.newaxis] + self._corners_offsets)
+        weights = np.prod(
+                np.where(self._corners, distances, 1 - distances), axis = 2)
+        return np.einsum('nc,nco->no', weights, values)
+
+    def get_simplex_many(self, input_vectors):
+        """Estimates the output vectors of a (N, input size) array of
+        input vectors using simplex interpolation. Returns a (N, output
+        size) array.
+
+        Each hypercube of the grid is split into simplices (Kuhn
+        triangulation). The simplex containing an input vector is found
+        by sorting its distances to the lowest corner in descending
+        order: its vertices are reached from the lowest corner by
+        stepping along each component in that order. Only the input
+        size + 1 vertices are blended, instead of the 2^(input size)
+        corners of the hypercube for linear interpolation.
+        """
+        input_indices = self._to_indices(input_vectors)
+        first_corners = np.floor(input_indices)
+        distances = input_indices - first_corners
+        count = len(distances)
+        order = np.argsort(-distances, axis = 1)
+        sorted_distances = distances[np.arange(count)[:, np.newaxis], order]
+        offsets = np.zeros((count, self._input_size + 1), np.int_)
+        offsets[:, 0] = np.dot(first_corners.astype(np.int_), self._strides)
+        offsets[:, 1:] = offsets[:, :1] + np.cumsum(
+                self._strides[order], axis = 1)
+        weights = np.empty((count, self._input_size + 1))
+        weights[:, 0] = 1 - sorted_distances[:, 0]
+        weights[:, 1:-1] = sorted_distances[:, :-1] - sorted_distances[:, 1:]
+        weights[:, -1] = sorted_distances[:, -1]
+        values = self._get_many(offsets)
+        return np.einsum('nc,nco->no', weights, values)
+
+    def _description(self, fingerprint = None):
+        """Description of the grid and the data saved with the lookup
+        table, in a form which is identical once loaded back from JSON.
+        """
+        input_specifications = [
+                {'from': float(x_from), 'to': float(x_to), 'points': int(x)}
+                for x_from, x_to, x in zip(
+                    self._input_from, self._input_to, self._input_points)]
+        output_ranges = None
+        if self._scale is not None:
+            maximum = np.iinfo(self._dtype).max
+            output_ranges = [
+                    [float(offset - maximum * scale),
+                        float(offset + maximum * scale)]
+                    for offset, scale in zip(self._offset, self._scale)]
+        return {
+                'input_specifications': input_specifications,
+                'output_size': self._output_size,
+                'dtype': self._dtype.str,
+                'output_ranges': output_ranges,
+                'fingerprint': fingerprint}
+
+    @staticmethod
+    def _filenames(filename):
+        """Data and description filenames of a saved lookup table"""
+        if filename.endswith('.npy'): filename = filename[:-len('.npy')]
+        return filename + '.npy', filename + '.json'
 
     def _to_indices(self, input_vector):
         """Converts an input vector to lookup table indices. The
@@ -68,17 +295,41 @@ class LookupTable:
         However they are always in the open inverval from 0 to
         self._input_points - 1.
         """
-        input_indices = np.array(input_vector)
+        input_indices = np.asfarray(input_vector)
         input_indices = input_indices - self._input_from
         input_indices = np.multiply(input_indices, self._input_points - 1)
         input_indices = np.divide(input_indices, self._input_span)
-        # Ensure indices are within bounds
+        return self._clamp_indices(input_indices)
+
+    def _clamp_indices(self, input_indices):
+        """Ensures lookup table indices are within bounds"""
         minimum = self._epsilon
         maximum = self._input_points - 1 - self._epsilon
         input_indices = np.maximum(input_indices, minimum)
         input_indices = np.minimum(input_indices, maximum)
         return input_indices
 
+    def _grid_indices(self):
+        """Indices of all the points of the grid as a (points, input
+        size) array, in the order of the flattened lookup table.
+        """
+        return np.indices(self._input_points).reshape(self._input_size, -1).T
+
+    def _serpentine_indices(self):
+        """Indices of all the points of the grid as a (points, input
+        size) array, ordered so that consecutive points are adjacent.
+        Each component runs backward whenever the sum of the previous
+        components is odd.
+        """
+        input_indices = self._grid_indices()
+        previous_sum = np.zeros(len(input_indices), np.int_)
+        for i in xrange(self._input_size):
+            backward = previous_sum % 2 == 1
+            input_indices[backward, i] = \
+                    self._input_points[i] - 1 - input_indices[backward, i]
+            previous_sum += input_indices[:, i]
+        return input_indices
+
     def _from_indices(self, input_indices):
         """Converts lookup table indices to an input vector"""
         input_vector = np.array(input_indices)
@@ -89,54 +340,350 @@ class LookupTable:
 
     def _get(self, input_indices):
         """Gets the output vector at a point of the grid."""
-        return self._table[tuple(input_indices)]
+        return self._dequantize(self._table[tuple(input_indices)])
+
+    def _get_many(self, offsets):
+        """Gets the output vectors at points of the grid given by their
+        offsets in the flattened lookup table. The result has the shape
+        of the offsets followed by the output size.
+        """
+        return self._dequantize(
+                self._table.reshape(-1, self._output_size)[offsets])
 
     def _set(self, input_indices, output_vector):
         """Sets the output vector at a point of the grid."""
-        self._table[tuple(input_indices)] = output_vector
-
-    def _iterate_all(self, function, input_indices = None, index = 0):
-        """Calls a function on all the points of the grid."""
-        if input_indices == None:
-            input_indices = np.zeros(self._input_size)
-        else: input_indices = np.asfarray(input_indices)
-        if index == self._input_size:
-            return np.asfarray(function(input_indices))
-        else:
-            for i in xrange(self._input_points[index]):
-                new_input_indices = input_indices.copy()
-                new_input_indices[index] = i
-                self._iterate_all(function,
-                        input_indices = new_input_indices,
-                        index = index + 1)
-
-    def _iterate_hypercube(self, function, input_indices, index = 0):
-        """Calls a function on all the corners of a hypercube made of
-        adjacent points of the grid. The input indices are for the
-        lowest corner.
-        """
-        input_indices = np.asfarray(input_indices)
-        if index == self._input_size:
-            return np.asfarray(function(input_indices))
+        self._table[tuple(input_indices)] = self._quantize(output_vector)
+
+    def _quantize(self, output_vectors, fit = False):
+        """Converts output vectors to the dtype of the lookup table. With
+        an integer dtype, the output ranges may be fitted to the output
+        vectors, and values out of range are clipped.
+        """
+        output_vectors = np.asfarray(output_vectors)
+        if not self._quantized: return output_vectors
+        if fit:
+            flat = output_vectors.reshape(-1, self._output_size)
+            self._set_output_ranges(flat.min(axis = 0), flat.max(axis = 0))
+        if self._scale is None:
+            raise ValueError('Lookup table has no output ranges to '
+                    'quantize its output vectors')
+        information = np.iinfo(self._dtype)
+        values = np.round((output_vectors - self._offset) / self._scale)
+        values = np.clip(values, information.min, information.max)
+        return values.astype(self._dtype)
+
+    def _dequantize(self, values):
+        """Converts values of the lookup table to float output vectors"""
+        if not self._quantized: return np.asarray(values, np.float64)
+        return values * self._scale + self._offset
+
+class AdaptiveLookupTable(LookupTable):
+    """Lookup table whose grid has non-uniform breakpoints along each
+    component of the input vector. Populating it with a maximum error
+    splits only the intervals of the grid where linear interpolation
+    differs too much from the function, so that a given worst-case
+    error needs fewer points than a uniform grid.
+    """
+
+    def __init__(self, input_specifications, output_size, epsilon = 1e-9,
+            dtype = np.float64, output_ranges = None):
+        """Constructor. The grid starts with uniform breakpoints, as for
+        a LookupTable.
+        """
+        LookupTable.__init__(self, input_specifications, output_size,
+                epsilon, dtype, output_ranges)
+        self._set_breakpoints([np.linspace(x_from, x_to, x)
+                for x_from, x_to, x in zip(
+                    self._input_from, self._input_to, self._input_points)])
+
+    def _set_breakpoints(self, breakpoints):
+        """Sets the breakpoints of the grid and allocates an empty lookup
+        table for them.
+        """
+        self._breakpoints = [np.asfarray(x) for x in breakpoints]
+        self._resize(tuple(len(x) for x in self._breakpoints))
+
+    def load(self, filename, mmap_mode = None, fingerprint = None):
+        """Loads the lookup table data and the breakpoints of its grid"""
+        _, description_filename = LookupTable._filenames(filename)
+        with open(description_filename) as description_file:
+            description = json.load(description_file)
+        self._set_breakpoints(description['breakpoints'])
+        LookupTable.load(self, filename, mmap_mode, fingerprint)
+
+    def populate(self, function, batched = False, processes = None,
+            chunk_size = None, max_error = None, max_points = None):
+        """Populates the lookup table at all the points of the grid. If a
+        maximum error is set, the grid is then refined until it is met,
+        or until the grid would have more than a maximum number of
+        points. Returns the largest error estimated in the last
+        refinement round (None without a maximum error).
+
+        The error of an interval is estimated at its midpoint, as the
+        largest norm of the difference between the function and linear
+        interpolation along that component, over all the grid points of
+        the other components. Intervals above the maximum error are
+        split at their midpoint, reusing the function values calculated
+        for the estimate. The refinement is done in float64, and the
+        lookup table is converted to its dtype at the end.
+        """
+        dtype, quantized = self._dtype, self._quantized
+        self._dtype, self._quantized = np.dtype(np.float64), False
+        try:
+            # The table allocated with the integer dtype would truncate
+            # the float outputs
+            self._resize(self._input_points)
+            largest_error = self._populate_refined(function, batched,
+                    processes, chunk_size, max_error, max_points)
+        finally:
+            self._dtype, self._quantized = dtype, quantized
+        table = self._table
+        self._table = np.zeros(table.shape, dtype)
+        self._table[...] = self._quantize(
+                table, fit = self._fit_output_ranges)
+        return largest_error
+
+    def _populate_refined(self, function, batched, processes, chunk_size,
+            max_error, max_points):
+        """Populates and refines the lookup table, see populate"""
+        evaluate = lambda input_vectors: _evaluate(
+                function, input_vectors, batched, processes, chunk_size)
+        LookupTable.populate(self, function, batched, processes, chunk_size)
+        if max_error is None: return None
+        while True:
+            midpoints, midpoints_values, splits = [], [], []
+            largest_error = 0.
+            for i, breakpoints in enumerate(self._breakpoints):
+                axes = list(self._breakpoints)
+                axes[i] = (breakpoints[:-1] + breakpoints[1:]) / 2
+                shape = [len(x) for x in axes] + [self._output_size]
+                values = evaluate(_cartesian(axes)).reshape(shape)
+                lerp = (self._table.take(np.arange(len(axes[i])), axis = i) +
+                        self._table.take(np.arange(1, len(breakpoints)),
+                            axis = i)) / 2
+                errors = np.sqrt(np.sum((values - lerp) ** 2, axis = -1))
+                errors = np.rollaxis(errors, i).reshape(len(axes[i]), -1)
+                errors = np.max(errors, axis = 1)
+                largest_error = max(largest_error, np.max(errors))
+                midpoints.append(axes[i])
+                midpoints_values.append(values)
+                splits.append(np.flatnonzero(errors > max_error))
+            points = np.prod([len(x) + len(split)
+                for x, split in zip(self._breakpoints, splits)])
+            if sum(len(x) for x in splits) == 0: break
+            if max_points is not None and points > max_points: break
+            self._refine(evaluate, midpoints, midpoints_values, splits)
+        return largest_error
+
+    def _refine(self, evaluate, midpoints, midpoints_values, splits):
+        """Splits intervals of the grid at their midpoint. The values of
+        the new grid points are copied from the previous lookup table or
+        from the values at the midpoints where possible, and calculated
+        otherwise.
+        """
+        old_breakpoints, old_table = self._breakpoints, self._table
+        self._set_breakpoints([np.sort(np.concatenate((x, m[split])))
+                for x, m, split in zip(old_breakpoints, midpoints, splits)])
+        old_positions = [np.searchsorted(x, old_x) for x, old_x in zip(
+                self._breakpoints, old_breakpoints)]
+        known = np.zeros(self._input_points, np.bool_)
+        self._table[np.ix_(*old_positions)] = old_table
+        known[np.ix_(*old_positions)] = True
+        for i, split in enumerate(splits):
+            if len(split) == 0: continue
+            positions = list(old_positions)
+            positions[i] = np.searchsorted(
+                    self._breakpoints[i], midpoints[i][split])
+            self._table[np.ix_(*positions)] = \
+                    midpoints_values[i].take(split, axis = i)
+            known[np.ix_(*positions)] = True
+        unknown = np.flatnonzero(~known)
+        if len(unknown) > 0:
+            input_indices = self._grid_indices()[unknown]
+            self._table.reshape(-1, self._output_size)[unknown] = \
+                    evaluate(self._from_indices(input_indices))
+
+    def _description(self, fingerprint = None):
+        """Description of the grid, including its breakpoints, and of the
+        data saved with the lookup table.
+        """
+        description = LookupTable._description(self, fingerprint)
+        description['breakpoints'] = [
+                [float(x) for x in breakpoints]
+                for breakpoints in self._breakpoints]
+        return description
+
+    def _to_indices(self, input_vector):
+        """Converts an input vector to lookup table indices, locating the
+        interval of each component among the breakpoints.
+        """
+        input_vector = np.asfarray(input_vector)
+        input_indices = np.empty(input_vector.shape)
+        for i, breakpoints in enumerate(self._breakpoints):
+            x = input_vector[..., i]
+            cells = np.searchsorted(breakpoints, x, 'right') - 1
+            cells = np.clip(cells, 0, len(breakpoints) - 2)
+            lows = breakpoints[cells]
+            input_indices[..., i] = \
+                    cells + (x - lows) / (breakpoints[cells + 1] - lows)
+        return self._clamp_indices(input_indices)
+
+    def _from_indices(self, input_indices):
+        """Converts integer lookup table indices to an input vector"""
+        input_indices = np.asarray(input_indices)
+        return np.stack([breakpoints[input_indices[..., i]]
+                for i, breakpoints in enumerate(self._breakpoints)],
+                axis = -1)
+
+class LazyLookupTable(LookupTable):
+    """Lookup table whose grid points are calculated the first time an
+    interpolation uses them. A validity bitmap tracks the calculated
+    points. If a filename is set, the calculated points are loaded from
+    it when they match the grid and the fingerprint, and are flushed to
+    it periodically so that later runs reuse them.
+    """
+
+    def __init__(self, input_specifications, output_size, filename = None,
+            fingerprint = None, flush_points = 64, epsilon = 1e-9,
+            dtype = np.float64, output_ranges = None):
+        """Constructor. The calculated points are flushed to the file
+        each time a number of new points were calculated. Since the
+        points are calculated separately, an integer dtype needs output
+        ranges.
+        """
+        LookupTable.__init__(self, input_specifications, output_size,
+                epsilon, dtype, output_ranges)
+        self._valid = np.zeros(np.prod(self._input_points), np.bool_)
+        self._function = None
+        self._batched = False
+        self._filename = filename
+        self._fingerprint = fingerprint
+        self._flush_points = int(flush_points)
+        self._pending = 0
+        if filename is not None:
+            try: self.load(filename, fingerprint = fingerprint)
+            except (IOError, ValueError): pass
+
+    def load(self, filename, mmap_mode = None, fingerprint = None):
+        """Loads the lookup table data and its validity bitmap. A lookup
+        table saved without a validity bitmap is fully calculated.
+        """
+        LookupTable.load(self, filename, mmap_mode, fingerprint)
+        valid_filename = LazyLookupTable._valid_filename(filename)
+        if os.path.isfile(valid_filename):
+            valid = np.load(valid_filename)
+            if valid.shape != self._valid.shape:
+                self._valid[:] = False
+                raise ValueError('Lookup table "' + filename +
+                        '" does not match the expected validity bitmap')
+            self._valid = valid
         else:
-            for i in xrange(2):
-                new_input_indices = input_indices.copy()
-                new_input_indices[index] += i
-                self._iterate_hypercube(function,
-                        input_indices = new_input_indices,
-                        index = index + 1)
+            self._valid = np.ones(self._valid.shape, np.bool_)
+
+    def save(self, filename, fingerprint = None, compressed = False):
+        """Saves the lookup table data and its validity bitmap"""
+        LookupTable.save(self, filename, fingerprint, compressed)
+        np.save(LazyLookupTable._valid_filename(filename), self._valid)
+
+    def flush(self):
+        """Saves the calculated points to the file, if one is set"""
+        if self._filename is not None and self._pending > 0:
+            self.save(self._filename, self._fingerprint)
+        self._pending = 0
+
+    def populate(self, function, batched = False, processes = None,
+            chunk_size = None):
+        """Sets the function calculating the grid points when they are
+        first used. No point is calculated up front. The points are
+        calculated in small batches in this process, so the number of
+        processes and chunk size are ignored.
+        """
+        self._function = function
+        self._batched = batched
+
+    def populate_continuation(self, function):
+        """Populates the lookup table at all the points of the grid along
+        a path through adjacent points, see LookupTable.
+        """
+        input_indices = LookupTable.populate_continuation(self, function)
+        self._valid[:] = True
+        self._pending += len(self._valid)
+        self.flush()
+        return input_indices
+
+    def valid_count(self):
+        """Number of grid points already calculated"""
+        return int(np.count_nonzero(self._valid))
 
     @staticmethod
-    def _process_lerp(weights, distances):
-        """Combines the linear interpolation weights and distances"""
-        if len(weights) == 1: return weights[0]
-        else:
-            d1 = 1 - distances[0]
-            d2 = distances[0]
-            new_weights = list()
-            while len(weights) > 0:
-                w1 = weights.pop(0)
-                w2 = weights.pop(0)
-                new_weights.append(w1 * d1 + w2 * d2)
-            new_distances = distances[1:]
-            return LookupTable._process_lerp(new_weights, new_distances)
+    def _valid_filename(filename):
+        """Validity bitmap filename of a saved lookup table"""
+        data_filename, _ = LookupTable._filenames(filename)
+        return data_filename[:-len('.npy')] + '_valid.npy'
+
+    def _get_many(self, offsets):
+        """Gets the output vectors at points of the grid given by their
+        offsets in the flattened lookup table, calculating the points
+        used for the first time.
+        """
+        offsets = np.asarray(offsets)
+        missing = np.unique(offsets[~self._valid[offsets]])
+        if len(missing) > 0: self._calculate(missing)
+        return LookupTable._get_many(self, offsets)
+
+    def _calculate(self, offsets):
+        """Calculates the points of the grid given by their offsets in the
+        flattened lookup table.
+        """
+        if self._function is None:
+            raise ValueError('Lookup table has no function to calculate '
+                    'its missing points')
+        input_indices = np.stack(
+                np.unravel_index(offsets, self._input_points), axis = -1)
+        output_vectors = _evaluate(self._function,
+                self._from_indices(input_indices), self._batched, None, None)
+        self._table.reshape(-1, self._output_size)[offsets] = \
+                self._quantize(output_vectors)
+        self._valid[offsets] = True
+        self._pending += len(offsets)
+        if self._pending >= self._flush_points: self.flush()
+
+def _cartesian(axes):
+    """Points of the grid spanned by the values of each component, as a
+    (points, components) array in the order of a flattened lookup table.
+    """
+    grids = np.meshgrid(*axes, indexing = 'ij')
+    return np.stack(grids, axis = -1).reshape(-1, len(axes))
+
+def _evaluate(function, input_vectors, batched, processes, chunk_size):
+    """Evaluates a function on a (N, input size) array of input vectors,
+    optionally split into chunks evaluated by a pool of worker processes.
+    Returns a (N, output size) array.
+    """
+    if chunk_size is None:
+        chunks_count = 1 if processes is None else 4 * processes
+        chunk_size = max(1, -(-len(input_vectors) // chunks_count))
+    chunks = [(function, batched, input_vectors[i:i + chunk_size])
+            for i in xrange(0, len(input_vectors), chunk_size)]
+    if processes is None:
+        outputs = [_populate_chunk(chunk) for chunk in chunks]
+    else:
+        pool = multiprocessing.Pool(processes)
+        try:
+            outputs = pool.map(_populate_chunk, chunks)
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+    return np.concatenate(outputs)
+
+def _populate_chunk(chunk):
+    """Evaluates a function on a chunk of input vectors. Defined at the
+    top level so that it can be sent to worker processes.
+    """
+    function, batched, input_vectors = chunk
+    if batched: output_vectors = function(input_vectors)
+    else: output_vectors = [function(x) for x in input_vectors]
+    return np.asfarray(output_vectors).reshape(len(input_vectors), -1)
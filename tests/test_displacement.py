@@ -79,3 +79,335 @@ class DisplacementTestCase(unittest.TestCase):
         d_2 = d_1.compose(d_1.inverse())
         npt.assert_almost_equal(d_0.translation, d_2.translation)
         npt.assert_almost_equal(d_0.rotation._matrix, d_2.rotation._matrix)
+
+class RotationArrayTestCase(unittest.TestCase):
+
+    def test_axis_angle(self):
+
+        axes = ((1, 0, 0), (0, 1, 0), (1, 2, 3))
+        angles = (0, tau / 8, -tau / 12)
+
+        # Each rotation of the batch matches the single rotation
+        r = RotationArray.axis_angle(axes, angles)
+        self.assertEqual(3, len(r))
+        for i in xrange(3):
+            npt.assert_almost_equal(
+                    Rotation.axis_angle(axes[i], angles[i])._matrix,
+                    r[i]._matrix)
+
+        # A single axis is shared by all the angles
+        r = RotationArray.axis_angle((0, 0, 1), angles)
+        for i in xrange(3):
+            npt.assert_almost_equal(
+                    Rotation.axis_angle((0, 0, 1), angles[i])._matrix,
+                    r[i]._matrix)
+
+    def test_rotate(self):
+
+        r = RotationArray.axis_angle((0, 0, 1), (tau / 4, tau / 2))
+
+        # Each vector is rotated by the matching rotation
+        npt.assert_almost_equal(((0, 1, 0), (0, -1, 0)),
+                r.rotate(((1, 0, 0), (0, 1, 0))))
+
+        # A single vector is rotated by all the rotations
+        npt.assert_almost_equal(((0, 1, 0), (-1, 0, 0)),
+                r.rotate((1, 0, 0)))
+
+    def test_compose(self):
+
+        r_x = Rotation.axis_angle((1, 0, 0), -tau / 4)
+        r_y = Rotation.axis_angle((0, 1, 0), tau / 4)
+        r_z = Rotation.axis_angle((0, 0, 1), tau / 4)
+        r_xz = RotationArray.from_rotations((r_x, r_z))
+        r_zy = RotationArray.from_rotations((r_z, r_y))
+
+        # Batched composition matches single compositions
+        r = r_xz.compose(r_zy)
+        npt.assert_almost_equal(r_x.compose(r_z)._matrix, r[0]._matrix)
+        npt.assert_almost_equal(r_z.compose(r_y)._matrix, r[1]._matrix)
+
+        # A single rotation is composed with all the rotations
+        r = r_xz.compose(r_y)
+        npt.assert_almost_equal(r_x.compose(r_y)._matrix, r[0]._matrix)
+        npt.assert_almost_equal(r_z.compose(r_y)._matrix, r[1]._matrix)
+
+    def test_inverse(self):
+
+        r = RotationArray.axis_angle(((1, 2, 3), (3, 2, 1)), tau / 12)
+
+        # Composition with own inverse is identity
+        npt.assert_almost_equal(
+                RotationArray(2)._matrices,
+                r.compose(r.inverse())._matrices)
+
+class DisplacementArrayTestCase(unittest.TestCase):
+
+    def test_compose(self):
+
+        r_z = Displacement(rotation = Rotation.axis_angle((0, 0, 1), tau / 4))
+        t_x = Displacement(translation = (1, 0, 0))
+        t_y = Displacement(translation = (0, 1, 0))
+        d_1 = DisplacementArray.from_displacements((r_z, t_y))
+        d_2 = DisplacementArray.from_displacements((t_x, r_z))
+
+        # Batched composition matches single compositions
+        d = d_1.compose(d_2)
+        for i, expected in enumerate((r_z.compose(t_x), t_y.compose(r_z))):
+            npt.assert_almost_equal(expected.translation, d[i].translation)
+            npt.assert_almost_equal(
+                    expected.rotation._matrix, d[i].rotation._matrix)
+
+        # A single displacement is composed with all the displacements
+        d = d_1.compose(t_x)
+        npt.assert_almost_equal(((0, 1, 0), (1, 1, 0)), d.translations)
+
+    def test_inverse(self):
+
+        d = DisplacementArray(
+                translations = ((1, 2, 3), (-1, 0, 2)),
+                rotations = RotationArray.axis_angle(
+                    ((3, 2, 1), (0, 1, 1)), (3 * tau / 16, tau / 5)))
+
+        # Composition with own inverse is identity
+        d_0 = d.compose(d.inverse())
+        npt.assert_almost_equal(np.zeros((2, 3)), d_0.translations)
+        npt.assert_almost_equal(RotationArray(2)._matrices,
+                d_0.rotations._matrices)
+
+class QuaternionTestCase(unittest.TestCase):
+
+    def test_axis_angle(self):
+
+        # Same rotations as the matrix implementation
+        for axis, angle in (((1, 0, 0), 0), ((0, 0, 1), tau / 4),
+                ((1, 2, 3), -tau / 12), ((1, 0, 0), tau / 2)):
+            q = Quaternion.axis_angle(axis, angle)
+            r = Rotation.axis_angle(axis, angle)
+            npt.assert_almost_equal(r._matrix, q.to_rotation()._matrix)
+            npt.assert_almost_equal(
+                    r._matrix,
+                    Quaternion.from_rotation(r).to_rotation()._matrix)
+            npt.assert_almost_equal(r.rotate((1, 2, 3)), q.rotate((1, 2, 3)))
+
+    def test_compose(self):
+
+        q_x = Quaternion.axis_angle((1, 0, 0), -tau / 4)
+        q_y = Quaternion.axis_angle((0, 1, 0), tau / 4)
+        r_x = Rotation.axis_angle((1, 0, 0), -tau / 4)
+        r_y = Rotation.axis_angle((0, 1, 0), tau / 4)
+
+        # Composition matches the matrix implementation
+        npt.assert_almost_equal(r_x.compose(r_y)._matrix,
+                q_x.compose(q_y).to_rotation()._matrix)
+        npt.assert_almost_equal(r_x.compose(r_y)._matrix,
+                q_x.compose(r_y).to_rotation()._matrix)
+        npt.assert_almost_equal(r_x.compose(r_y)._matrix,
+                r_x.compose(q_y)._matrix)
+        out = Quaternion()
+        q_x.compose_into(r_y, out)
+        npt.assert_almost_equal(r_x.compose(r_y)._matrix,
+                out.to_rotation()._matrix)
+        out = Rotation()
+        r_x.compose_into(q_y, out)
+        npt.assert_almost_equal(r_x.compose(r_y)._matrix, out._matrix)
+
+        # Composition with own inverse is identity
+        q = Quaternion.axis_angle((1, 2, 3), tau / 12)
+        npt.assert_almost_equal(
+                Quaternion()._quaternion,
+                q.compose(q.inverse())._quaternion)
+
+        # Interchangeable with matrix rotations in displacements
+        d = Displacement(translation = (1, 0, 0), rotation = q_x)
+        npt.assert_almost_equal(
+                Displacement(translation = (1, 0, 0), rotation = r_x).compose(
+                    d).translation,
+                d.compose(d).translation)
+
+    def test_normalize(self):
+
+        # Repeated compositions drift, normalization restores unit norm
+        q = Quaternion.axis_angle((1, 2, 3), 0.1)
+        q._quaternion *= 1.01
+        q.normalize()
+        self.assertAlmostEqual(1, np.linalg.norm(q._quaternion))
+        npt.assert_almost_equal(
+                Quaternion.axis_angle((1, 2, 3), 0.1)._quaternion,
+                q._quaternion)
+
+    def test_slerp(self):
+
+        q_0 = Quaternion.axis_angle((0, 0, 1), 0)
+        q_1 = Quaternion.axis_angle((0, 0, 1), tau / 4)
+
+        # Interpolation of the angle around a shared axis
+        npt.assert_almost_equal(
+                Quaternion.axis_angle((0, 0, 1), tau / 16)._quaternion,
+                q_0.slerp(q_1, 0.25)._quaternion)
+        npt.assert_almost_equal(q_1._quaternion, q_0.slerp(q_1, 1)._quaternion)
+
+        # Shortest arc, even if the quaternions have opposite signs
+        q_2 = Quaternion.axis_angle((0, 0, 1), tau - tau / 8)
+        npt.assert_almost_equal(
+                Quaternion.axis_angle((0, 0, 1), tau / 16)._quaternion,
+                q_1.slerp(q_2, 0.5)._quaternion)
+
+        # Close quaternions
+        q_3 = Quaternion.axis_angle((0, 0, 1), 1e-9)
+        npt.assert_almost_equal(q_0._quaternion,
+                q_0.slerp(q_3, 0.5)._quaternion)
+
+class QuaternionArrayTestCase(unittest.TestCase):
+
+    def test_axis_angle(self):
+
+        axes = ((1, 0, 0), (0, 1, 0), (1, 2, 3))
+        angles = (0, tau / 8, -tau / 12)
+
+        # Each rotation of the batch matches the single rotation
+        q = QuaternionArray.axis_angle(axes, angles)
+        self.assertEqual(3, len(q))
+        for i in xrange(3):
+            npt.assert_almost_equal(
+                    Quaternion.axis_angle(axes[i], angles[i])._quaternion,
+                    q[i]._quaternion)
+
+        # A single axis is shared by all the angles, and conversions match
+        # the matrix implementation
+        q = QuaternionArray.axis_angle((0, 0, 1), angles)
+        r = RotationArray.axis_angle((0, 0, 1), angles)
+        npt.assert_almost_equal(r._matrices, q.to_rotation_array()._matrices)
+        npt.assert_almost_equal(q._quaternions,
+                QuaternionArray.from_rotation_array(r)._quaternions)
+
+    def test_rotate_compose_inverse(self):
+
+        q = QuaternionArray.axis_angle(((1, 2, 3), (0, 0, 1)), (1, tau / 4))
+        r = q.to_rotation_array()
+        other = QuaternionArray.axis_angle((3, 2, 1), (0.5, -0.5))
+
+        npt.assert_almost_equal(r.rotate(((1, 0, 0), (0, 1, 0))),
+                q.rotate(((1, 0, 0), (0, 1, 0))))
+        npt.assert_almost_equal(r.rotate((1, 0, 0)), q.rotate((1, 0, 0)))
+        npt.assert_almost_equal(
+                r.compose(other.to_rotation_array())._matrices,
+                q.compose(other).to_rotation_array()._matrices)
+        npt.assert_almost_equal(
+                r.compose(other[0].to_rotation())._matrices,
+                q.compose(other[0]).to_rotation_array()._matrices)
+        npt.assert_almost_equal(QuaternionArray(2)._quaternions,
+                q.compose(q.inverse())._quaternions)
+
+        # Mixed operands, either way
+        expected = r.compose(other.to_rotation_array())._matrices
+        npt.assert_almost_equal(expected,
+                q.compose(other.to_rotation_array()).to_rotation_array()
+                ._matrices)
+        npt.assert_almost_equal(expected, r.compose(other)._matrices)
+        npt.assert_almost_equal(
+                r.compose(other[0].to_rotation())._matrices,
+                q.compose(other[0].to_rotation()).to_rotation_array()
+                ._matrices)
+        npt.assert_almost_equal(
+                r.compose(other[0].to_rotation())._matrices,
+                r.compose(other[0])._matrices)
+
+    def test_normalize_slerp(self):
+        q = QuaternionArray.axis_angle((0, 0, 1), (0, tau / 4))
+        q._quaternions *= ((2,), (0.5,))
+        q.normalize()
+        npt.assert_almost_equal(
+                QuaternionArray.axis_angle(
+                    (0, 0, 1), (0, tau / 4))._quaternions,
+                q._quaternions)
+
+        # Interpolation toward a single quaternion, one value per rotation
+        other = Quaternion.axis_angle((0, 0, 1), 3 * tau / 8)
+        npt.assert_almost_equal(
+                QuaternionArray.axis_angle(
+                    (0, 0, 1), (3 * tau / 16, 5 * tau / 16))._quaternions,
+                q.slerp(other, (0.5, 0.5))._quaternions)
+
+class InPlaceTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.d_1 = Displacement(
+                translation = (1, 2, 3),
+                rotation = Rotation.axis_angle((3, 2, 1), 3 * tau / 16))
+        self.d_2 = Displacement(
+                translation = (-1, 0, 2),
+                rotation = Rotation.axis_angle((0, 1, 1), tau / 5))
+
+    def assertDisplacementAlmostEqual(self, expected, actual):
+        npt.assert_almost_equal(expected.translation, actual.translation)
+        npt.assert_almost_equal(
+                expected.rotation._matrix, actual.rotation._matrix)
+
+    def test_rotation(self):
+        r_1, r_2 = self.d_1.rotation, self.d_2.rotation
+        out = np.empty(3)
+        r_1.rotate_into(np.array((1., 2, 3)), out)
+        npt.assert_almost_equal(r_1.rotate((1, 2, 3)), out)
+        r_1.rotate_into(out, out)
+        npt.assert_almost_equal(r_1.rotate(r_1.rotate((1, 2, 3))), out)
+
+        out = Rotation()
+        r_1.compose_into(r_2, out)
+        npt.assert_almost_equal(r_1.compose(r_2)._matrix, out._matrix)
+        r_1.inverse_into(out)
+        npt.assert_almost_equal(r_1.inverse()._matrix, out._matrix)
+
+        # Operands may be overwritten
+        expected = r_1.compose(r_2)
+        r_1.compose_into(r_2, r_2)
+        npt.assert_almost_equal(expected._matrix, r_2._matrix)
+        expected = r_1.inverse()
+        r_1.inverse_into(r_1)
+        npt.assert_almost_equal(expected._matrix, r_1._matrix)
+
+    def test_quaternion(self):
+        q_1 = Quaternion.axis_angle((3, 2, 1), 3 * tau / 16)
+        q_2 = Quaternion.axis_angle((0, 1, 1), tau / 5)
+        out = np.empty(3)
+        q_1.rotate_into((1, 2, 3), out)
+        npt.assert_almost_equal(q_1.rotate((1, 2, 3)), out)
+        expected = q_1.compose(q_2)
+        q_1.compose_into(q_2, q_2)
+        npt.assert_almost_equal(expected._quaternion, q_2._quaternion)
+        expected = q_1.inverse()
+        q_1.inverse_into(q_1)
+        npt.assert_almost_equal(expected._quaternion, q_1._quaternion)
+
+    def test_displacement(self):
+        d_1, d_2 = self.d_1, self.d_2
+        out = Displacement()
+        d_1.compose_into(d_2, out)
+        self.assertDisplacementAlmostEqual(d_1.compose(d_2), out)
+        d_1.inverse_into(out)
+        self.assertDisplacementAlmostEqual(d_1.inverse(), out)
+
+        # Operands may be overwritten
+        expected = d_1.compose(d_2)
+        d_1.compose_into(d_2, d_1)
+        self.assertDisplacementAlmostEqual(expected, d_1)
+        expected = d_2.compose(d_1)
+        d_2.compose_into(d_1, d_1)
+        self.assertDisplacementAlmostEqual(expected, d_1)
+        expected = d_1.inverse()
+        d_1.inverse_into(d_1)
+        self.assertDisplacementAlmostEqual(expected, d_1)
+
+    def test_no_copy(self):
+        translation = np.array((1., 2, 3))
+        rotation = Rotation()
+        d = Displacement(translation, rotation, copy = False)
+        self.assertIs(translation, d.translation)
+        self.assertIs(rotation, d.rotation)
+        d = Displacement(translation, rotation)
+        self.assertIsNot(translation, d.translation)
+        self.assertIsNot(rotation, d.rotation)
+
+        # Slots, no per-instance dictionary
+        self.assertRaises(AttributeError, setattr, d, 'scale', 2)
+        self.assertRaises(AttributeError, setattr, rotation, 'scale', 2)
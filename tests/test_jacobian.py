@@ -19,6 +19,39 @@ class JacobianMatrixTestCase(unittest.TestCase):
         npt.assert_almost_equal(matrix, f_solver._jacobian_matrix(
                 input_vector = (1, 2, 3)))
 
+    def test_analytic_jacobian_matrix(self):
+
+        matrix = ((1, 0, 3), (0, 2, 2), (1, 2, 1))
+        calls = list()
+        def f(x):
+            calls.append(x)
+            return np.dot(matrix, x)
+        f_solver = JacobianSolver(
+                function = f,
+                jacobian = lambda x: matrix)
+
+        # The Jacobian matrix is provided without evaluating the function
+        npt.assert_almost_equal(matrix, f_solver._jacobian_matrix(
+                input_vector = (1, 2, 3)))
+        self.assertEqual(0, len(calls))
+
+    def test_sparse_jacobian_matrix(self):
+
+        matrix = ((1, 0, 3, 0), (0, 2, 0, 0), (1, 2, 0, 0), (0, 0, 0, 1))
+        calls = list()
+        def f(x):
+            calls.append(x)
+            return np.dot(matrix, x)
+        f_solver = JacobianSolver(
+                function = f,
+                dependency_mask = np.not_equal(matrix, 0))
+
+        # Inputs with disjoint dependent outputs are probed together: the
+        # Jacobian matrix requires three function calls instead of five.
+        npt.assert_almost_equal(matrix, f_solver._jacobian_matrix(
+                input_vector = (1, 2, 3, 4)))
+        self.assertEqual(3, len(calls))
+
 class JacobianInverseSolverTestCase(unittest.TestCase):
 
     def test_converge(self):
@@ -80,6 +113,35 @@ class JacobianInverseSolverTestCase(unittest.TestCase):
                 target_output_vector = (1, 2, 3))
         npt.assert_almost_equal((1, 1, 0), input_vector)
 
+    def test_solve(self):
+
+        matrix = ((1, 0, 3), (0, 2, 2), (1, 2, 1))
+        f = lambda x: np.dot(matrix, x)
+        f_solver = JacobianInverseSolver(function = f)
+
+        # For a linear map the solver converges after a single iteration
+        result = f_solver.solve(
+                input_vector = (0, 0, 0),
+                target_output_vector = (1, 2, 3))
+        self.assertTrue(result.converged)
+        self.assertEqual(1, result.iterations)
+        npt.assert_almost_equal((1, 1, 0), result.input_vector)
+        npt.assert_almost_equal((1, 2, 3), result.output_vector)
+
+    def test_converge_sparse(self):
+
+        matrix = ((1, 0, 3, 0), (0, 2, 2, 0), (1, 2, 1, 0), (0, 0, 0, 2))
+        f = lambda x: np.dot(matrix, x)
+        f_solver = JacobianInverseSolver(
+                function = f,
+                dependency_mask = np.not_equal(matrix, 0))
+
+        # Independent blocks of the system are solved separately and give
+        # the same result as the whole system.
+        npt.assert_almost_equal((1, 1, 0, 2), f_solver.converge(
+                input_vector = (0, 0, 0, 0),
+                target_output_vector = (1, 2, 3, 4)))
+
 class DampedLeastSquaresSolverTest(unittest.TestCase):
 
     def test_converge(self):
@@ -96,3 +158,162 @@ class DampedLeastSquaresSolverTest(unittest.TestCase):
                     input_vector = input_vector,
                     target_output_vector = (1, 2, 3))
         npt.assert_almost_equal((1, 1, 0), input_vector)
+
+    def test_solve(self):
+
+        matrix = ((1, 0, 3), (0, 2, 2), (1, 2, 1))
+        f = lambda x: np.dot(matrix, x)
+
+        # The adaptive damping converges within far fewer iterations than
+        # the constant damping.
+        f_solver = DampedLeastSquaresSolver(function = f, constant = 1)
+        result = f_solver.solve(
+                input_vector = (0, 0, 0),
+                target_output_vector = (1, 2, 3),
+                output_tolerance = 1e-9)
+        self.assertTrue(result.converged)
+        self.assertLess(result.iterations, 10)
+        npt.assert_almost_equal((1, 1, 0), result.input_vector)
+
+    def test_solve_unreachable(self):
+
+        f = lambda x: (x[0]**2 + 1, x[1])
+
+        # The closest output vector is reached and the solve stops when
+        # the input vector no longer moves, within the iterations budget.
+        f_solver = DampedLeastSquaresSolver(function = f, constant = 1)
+        result = f_solver.solve(
+                input_vector = (1, 0),
+                target_output_vector = (0, 1),
+                max_iterations = 100,
+                input_tolerance = 1e-6)
+        self.assertFalse(result.converged)
+        self.assertLess(result.iterations, 100)
+        self.assertAlmostEqual(1, result.error, places = 5)
+        npt.assert_almost_equal((0, 1), result.input_vector, decimal = 3)
+
+class BroydenSolverTest(unittest.TestCase):
+
+    def test_converge(self):
+
+        matrix = ((1, 0, 3), (0, 2, 2), (1, 2, 1))
+        calls = list()
+        def f(x):
+            calls.append(x)
+            return np.dot(matrix, x)
+        f_solver = BroydenSolver(function = f, constant = 1)
+
+        # For a linear map the Broyden updates keep the Jacobian matrix
+        # exact, so it is only estimated by finite differences once.
+        input_vector = (0, 0, 0)
+        for n in xrange(50):
+            input_vector = f_solver.converge(
+                    input_vector = input_vector,
+                    target_output_vector = (1, 2, 3))
+        npt.assert_almost_equal((1, 1, 0), input_vector)
+        self.assertEqual(50 + 3, len(calls))
+
+    def test_solve(self):
+
+        f = lambda x: (np.sin(x[0]) + x[1], x[0] * x[1])
+        f_solver = BroydenSolver(function = f, constant = 0.1)
+
+        # A nonlinear function converges with an estimated Jacobian matrix
+        result = f_solver.solve(
+                input_vector = (0.1, 0.1),
+                target_output_vector = (1, 0.2),
+                output_tolerance = 1e-9)
+        self.assertTrue(result.converged)
+        npt.assert_almost_equal((1, 0.2), f(result.input_vector))
+
+    def test_converge_after_solve(self):
+
+        matrix = ((1, 0, 3), (0, 2, 2), (1, 2, 1))
+        calls = list()
+        def f(x):
+            calls.append(x)
+            return np.dot(matrix, x)
+        f_solver = BroydenSolver(function = f, constant = 1)
+        input_vector = f_solver.converge(
+                input_vector = (0, 0, 0),
+                target_output_vector = (1, 2, 3))
+
+        # A solve which got closer to its target is not followed by a
+        # refresh of the estimate
+        result = f_solver.solve(
+                input_vector = input_vector,
+                target_output_vector = (10, -5, 4),
+                output_tolerance = 1e-9)
+        self.assertTrue(result.converged)
+        del calls[:]
+        f_solver.converge(
+                input_vector = result.input_vector,
+                target_output_vector = (10, -5, 4),
+                output_vector = result.output_vector)
+        self.assertEqual(0, len(calls))
+
+class BatchDampedLeastSquaresSolverTest(unittest.TestCase):
+
+    def test_converge(self):
+
+        matrix = ((1, 0, 3), (0, 2, 2), (1, 2, 1))
+        f = lambda x: np.dot(x, np.transpose(matrix))
+        f_solver = BatchDampedLeastSquaresSolver(
+                function = f, constant = 1, max_input_fix = 0.2)
+        single_solver = DampedLeastSquaresSolver(
+                function = lambda x: np.dot(matrix, x), constant = 1,
+                max_input_fix = 0.2)
+        input_vectors = ((0, 0, 0), (1, 2, 3))
+        target_output_vectors = ((1, 2, 3), (-1, 0, 1))
+
+        # Each problem takes the same step as with a single solver
+        output = f_solver.converge(
+                input_vectors = input_vectors,
+                target_output_vectors = target_output_vectors)
+        for i in xrange(2):
+            npt.assert_almost_equal(single_solver.converge(
+                    input_vector = input_vectors[i],
+                    target_output_vector = target_output_vectors[i]),
+                    output[i])
+
+    def test_solve(self):
+
+        rows = list()
+        def f(x):
+            rows.append(len(x))
+            return np.column_stack(
+                    (np.sin(x[:, 0]) + x[:, 1], x[:, 0] * x[:, 1]))
+        f_solver = BatchDampedLeastSquaresSolver(function = f, constant = 0.1)
+
+        # All the problems converge, except the problem starting at its
+        # target which does not iterate and is never evaluated again.
+        result = f_solver.solve(
+                input_vectors = ((0.1, 0.1), (0.5, 0.5), (0, 0), (1, 1)),
+                target_output_vectors = (
+                    (1, 0.2), (0.5, -0.1), (0, 0), (1.5, 0.5)),
+                output_tolerance = 1e-9)
+        self.assertTrue(np.all(result.converged))
+        self.assertEqual(0, result.iterations[2])
+        self.assertTrue(np.all(result.iterations[[0, 1, 3]] > 0))
+        npt.assert_almost_equal(
+                ((1, 0.2), (0.5, -0.1), (0, 0), (1.5, 0.5)),
+                f(result.input_vector))
+        self.assertEqual(4, rows[0])
+        self.assertTrue(all(n <= 3 for n in rows[1:-1]))
+
+        # Without an iterations budget no step is taken, as with a single
+        # solver
+        result = f_solver.solve(
+                input_vectors = ((0.1, 0.1), (0.5, 0.5)),
+                target_output_vectors = ((1, 0.2), (0.5, -0.1)),
+                max_iterations = 0)
+        npt.assert_equal((0, 0), result.iterations)
+        npt.assert_almost_equal(((0.1, 0.1), (0.5, 0.5)),
+                result.input_vector)
+        single_result = DampedLeastSquaresSolver(
+                function = lambda x: f(np.array([x]))[0],
+                constant = 0.1).solve(
+                    input_vector = (0.1, 0.1),
+                    target_output_vector = (1, 0.2),
+                    max_iterations = 0)
+        self.assertEqual(0, single_result.iterations)
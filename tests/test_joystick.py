@@ -0,0 +1,98 @@
+import unittest
+
+import os
+import struct
+import time
+
+from robotics.joystick import *
+
+class PipeJoystick(Joystick):
+    """Joystick reading its events from a pipe instead of a device"""
+
+    def __init__(self):
+        """Constructor"""
+        self.axis_map = ['x', 'y']
+        self.button_map = ['a']
+        self.axis_states = {'x': 0.0, 'y': 0.0}
+        self.button_states = {'a': 0}
+        self._read_fd, self.write_fd = os.pipe()
+        self._initialize_reader(self._read_fd)
+
+    def close(self):
+        """Closes the pipe"""
+        self.stop()
+        for fd in (self._read_fd, self.write_fd):
+            try: os.close(fd)
+            except OSError: pass
+
+def _event(time, value, type, number):
+    return struct.pack('IhBB', time, value, type, number)
+
+def _wait(condition):
+    for _ in xrange(200):
+        if condition(): return
+        time.sleep(0.01)
+
+class JoystickTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.joystick = PipeJoystick()
+
+    def tearDown(self):
+        self.joystick.close()
+
+    def test_update(self):
+        joystick = self.joystick
+        self.assertIsNone(joystick.snapshot().time)
+
+        # An event split across reads is applied once complete
+        button_event = _event(11, 1, 0x01, 0)
+        os.write(joystick.write_fd,
+                _event(10, 32767, 0x02, 0) + button_event[:5])
+        joystick.update()
+        self.assertEqual({'x': 1.0, 'y': 0.0}, joystick.axis_states)
+        self.assertEqual({'a': 0}, joystick.button_states)
+        self.assertEqual(10, joystick.snapshot().time)
+        os.write(joystick.write_fd, button_event[5:])
+        joystick.update()
+        self.assertEqual({'a': 1}, joystick.button_states)
+        self.assertEqual(11, joystick.snapshot().time)
+
+        # The device being closed is reported
+        os.close(joystick.write_fd)
+        self.assertRaises(IOError, joystick.update)
+
+    def test_start_stop(self):
+        joystick = self.joystick
+        joystick.start()
+
+        # Large batches, including split events, are published as
+        # snapshots without calling update
+        events = ''.join(_event(100 + i, -i, 0x02, 1) for i in xrange(200))
+        os.write(joystick.write_fd, events[:803])
+        os.write(joystick.write_fd, events[803:])
+        _wait(lambda: joystick.snapshot().time == 299)
+        snapshot = joystick.snapshot()
+        self.assertEqual(299, snapshot.time)
+        self.assertAlmostEqual(-199 / 32767.0, snapshot.axis_states['y'])
+        self.assertEqual({'x': 0.0, 'y': 0.0}, joystick.axis_states)
+        joystick.update()
+        self.assertEqual(snapshot.axis_states, joystick.axis_states)
+
+        joystick.stop()
+        self.assertIsNone(joystick._thread)
+        self.assertFalse(joystick._running)
+
+    def test_reader_failure(self):
+        joystick = self.joystick
+        joystick.start()
+        os.write(joystick.write_fd, _event(5, 32767, 0x02, 0))
+        _wait(lambda: joystick.snapshot().time == 5)
+
+        # The thread stops when the device is closed, and the state is
+        # no longer served
+        os.close(joystick.write_fd)
+        _wait(lambda: not joystick._running)
+        self.assertFalse(joystick._running)
+        self.assertRaises(IOError, joystick.snapshot)
+        self.assertRaises(IOError, joystick.update)
@@ -0,0 +1,152 @@
+import unittest
+import numpy as np
+import numpy.testing as npt
+
+import sys
+import types
+
+# The drawing functions need VPython, which the kinematics do not
+try: import visual
+except ImportError: sys.modules['visual'] = types.ModuleType('visual')
+
+from robotics.kinematics.multipod import *
+
+def _lookup_table():
+    """Coarse leg lookup table"""
+    lookup_table = LookupTable(
+            input_specifications = [
+                {'from': -0.5, 'to': 0.5, 'points': 5},
+                {'from': -0.5, 'to': 0.5, 'points': 5},
+                {'from': -0.5, 'to': 0.5, 'points': 5}],
+            output_size = 3)
+    LookupTableLeg.populate(lookup_table)
+    return lookup_table
+
+class AnalyticSolverLegTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.random = np.random.RandomState(0)
+
+    def test_forward_kinematics(self):
+        leg = Leg()
+        joints_angles = self.random.uniform(-2, 2, (10, 3))
+        npt.assert_almost_equal(
+                [leg.endpoint(x) for x in joints_angles],
+                AnalyticSolverLeg.forward_kinematics(joints_angles))
+
+    def test_inverse_kinematics(self):
+        # Targets within reach, including ones needing large angles
+        joints_angles = self.random.uniform(
+                (-2, -1, 0.3), (2, 1, 2.5), (20, 3))
+        local_endpoints = AnalyticSolverLeg.forward_kinematics(
+                joints_angles)
+        solutions = list()
+        for elbow_up in (True, False):
+            solution, reachable = AnalyticSolverLeg.inverse_kinematics(
+                    local_endpoints, elbow_up = elbow_up)
+            self.assertTrue(np.all(reachable))
+            npt.assert_almost_equal(local_endpoints,
+                    AnalyticSolverLeg.forward_kinematics(solution))
+            solutions.append(solution)
+
+        # The two elbow branches are different configurations
+        self.assertTrue(np.all(
+                np.abs(solutions[0][:, 2] - solutions[1][:, 2]) > 1e-3))
+
+    def test_out_of_reach(self):
+        # Beyond the stretched leg, and closer than the folded leg
+        reach = Leg.coxa_length + Leg.femur_length + Leg.tibia_length
+        fold = Leg.coxa_length + Leg.tibia_length - Leg.femur_length
+        local_endpoints = [(reach + 0.1, 0, 0), (0, -reach - 1, 0.5),
+                (fold - 0.1, 0, 0), (Leg.coxa_length, 0, 0)]
+        joints_angles, reachable = AnalyticSolverLeg.inverse_kinematics(
+                local_endpoints)
+        self.assertFalse(np.any(reachable))
+
+        # The leg still points toward the target
+        endpoints = AnalyticSolverLeg.forward_kinematics(joints_angles)
+        npt.assert_almost_equal(0, endpoints[1, 0])
+        self.assertLess(endpoints[1, 1], 0)
+
+    def test_endpoint_inverse_kinematics(self):
+        mount = Displacement(
+                translation = (1, 0.5, 0),
+                rotation = Rotation.axis_angle((0, 0, 1), 0.7))
+        for elbow_up in (True, False):
+            leg = AnalyticSolverLeg(
+                    initial_displacement = mount, elbow_up = elbow_up)
+            for target_offset in self.random.uniform(-0.5, 0.5, (5, 3)):
+                leg.endpoint_inverse_kinematics(target_offset)
+                npt.assert_almost_equal(
+                        leg._default_endpoint + target_offset,
+                        leg._endpoint)
+
+class LookupTableLegTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.lookup_table = _lookup_table()
+
+    def test_refine(self):
+        mount = Displacement(
+                translation = (1, 0, 0),
+                rotation = Rotation.axis_angle((0, 0, 1), 2))
+        leg = LookupTableLeg(self.lookup_table, initial_displacement = mount)
+        refined_leg = LookupTableLeg(self.lookup_table,
+                initial_displacement = mount,
+                refine_iterations = 10,
+                tolerance = 1e-6)
+        self.assertIsNone(leg._solver)
+        random = np.random.RandomState(0)
+        for target_offset in random.uniform(-0.4, 0.4, (5, 3)):
+            target_endpoint = leg._default_endpoint + target_offset
+            leg.endpoint_inverse_kinematics(target_offset)
+            refined_leg.endpoint_inverse_kinematics(target_offset)
+
+            # The coarse lookup table alone is approximate, the refined
+            # joints angles reach the target
+            error = np.linalg.norm(leg._endpoint - target_endpoint)
+            self.assertGreater(error, 1e-6)
+            self.assertLess(error, 0.1)
+            npt.assert_almost_equal(target_endpoint, refined_leg._endpoint,
+                    decimal = 5)
+            npt.assert_almost_equal(refined_leg._endpoint,
+                    refined_leg.endpoint(refined_leg._joints_angles))
+
+class MultipodTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.lookup_table = _lookup_table()
+
+    def test_endpoints_inverse_kinematics(self):
+        legs_count = 6
+        rotations = RotationArray.axis_angle(
+                (0, 0, 1), np.arange(legs_count) * tau / legs_count)
+        mounts = DisplacementArray(rotations = rotations).compose(
+                Displacement(translation = (1, 0, 0)))
+        multipod = Multipod(
+                mount_displacements = mounts,
+                lookup_table = self.lookup_table)
+        self.assertEqual(legs_count, len(multipod))
+        legs = [LookupTableLeg(self.lookup_table,
+                initial_displacement = mounts[i])
+                for i in xrange(legs_count)]
+        npt.assert_almost_equal([leg._endpoint for leg in legs],
+                multipod.endpoints())
+
+        # The joints angles and endpoints of all the legs are the same as
+        # with separate legs, for a shared target offset and for one
+        # offset per leg
+        random = np.random.RandomState(0)
+        for target_offsets in (np.array([0.2, -0.1, 0.3]),
+                random.uniform(-0.4, 0.4, (legs_count, 3))):
+            multipod.endpoints_inverse_kinematics(target_offsets)
+            target_offsets = np.broadcast_to(
+                    target_offsets, (legs_count, 3))
+            for i, leg in enumerate(legs):
+                leg.endpoint_inverse_kinematics(target_offsets[i])
+                npt.assert_almost_equal(
+                        leg._joints_angles, multipod.joints_angles()[i])
+                npt.assert_almost_equal(
+                        leg._endpoint, multipod.endpoints()[i])
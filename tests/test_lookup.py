@@ -2,7 +2,10 @@ import unittest
 import numpy as np
 import numpy.testing as npt
 
+import multiprocessing
 import os
+import shutil
+import tempfile
 
 from robotics.lookup import *
 
@@ -81,3 +84,458 @@ class LookupTableTestCase(unittest.TestCase):
         npt.assert_almost_equal([1.25, 0.75], lookup_table.get_lerp([2, 0.25]))
         npt.assert_almost_equal([0.75, 0.75], lookup_table.get_lerp([0.75, -1]))
         npt.assert_almost_equal([1.25, -0.75], lookup_table.get_lerp([0.25, 2]))
+
+    def test_3d_many(self):
+
+        # Lookup table for a linear 3D function
+        def f(x):
+            return (x[0] + 2 * x[1] - x[2], 1 - x[0] * 0.5 + x[2])
+        lookup_table = LookupTable(
+                input_specifications = [
+                    {'from': -1, 'to': 1, 'points': 3},
+                    {'from': 0, 'to': 2, 'points': 5},
+                    {'from': 0, 'to': 1, 'points': 2}],
+                output_size = 2)
+        lookup_table.populate(function = f)
+        input_vectors = np.array((
+                (-1, 0, 0), (1, 2, 1), (0.3, 1.7, 0.2), (-0.9, 0.1, 0.6)))
+
+        # Linear interpolation of a linear function is exact
+        npt.assert_almost_equal(
+                [f(x) for x in input_vectors],
+                lookup_table.get_lerp_many(input_vectors))
+
+        # Nearest interpolation matches the single point queries
+        npt.assert_almost_equal(
+                [lookup_table.get_nearest(x) for x in input_vectors],
+                lookup_table.get_nearest_many(input_vectors))
+        npt.assert_almost_equal(
+                [f((0, 2, 0)), f((-1, 0, 1))],
+                lookup_table.get_nearest_many(((0.2, 2.2, 0.1), (-2, 0, 1))))
+
+    def test_simplex(self):
+
+        # Lookup table for a linear 3D function
+        def f(x):
+            return (x[0] + 2 * x[1] - x[2], 1 - x[0] * 0.5 + x[2])
+        lookup_table = LookupTable(
+                input_specifications = [
+                    {'from': -1, 'to': 1, 'points': 3},
+                    {'from': 0, 'to': 2, 'points': 5},
+                    {'from': 0, 'to': 1, 'points': 2}],
+                output_size = 2)
+        lookup_table.populate(function = f)
+        input_vectors = np.array((
+                (-1, 0, 0), (1, 2, 1), (0.3, 1.7, 0.2), (-0.9, 0.1, 0.6)))
+
+        # Simplex interpolation of a linear function is exact
+        npt.assert_almost_equal(
+                [f(x) for x in input_vectors],
+                lookup_table.get_simplex_many(input_vectors))
+        npt.assert_almost_equal(
+                f((0.3, 1.7, 0.2)), lookup_table.get_simplex((0.3, 1.7, 0.2)))
+
+        # Simplex interpolation outside of grid bounds
+        npt.assert_almost_equal(
+                f((1, 0, 0.5)), lookup_table.get_simplex((2, -1, 0.5)))
+
+    def test_2d_simplex(self):
+
+        # Lookup table for a nonlinear 2D function
+        lookup_table = LookupTable(
+                input_specifications = [
+                    {'from': 0, 'to': 1, 'points': 2},
+                    {'from': 0, 'to': 1, 'points': 2}],
+                output_size = 1)
+        lookup_table.populate(function = lambda x: [x[0] * x[1]])
+
+        # The square is split along its diagonal from the lowest to the
+        # highest corner into two triangles, each interpolating its own
+        # three corners: only the highest corner is not zero.
+        npt.assert_almost_equal(
+                [0.25], lookup_table.get_simplex([0.75, 0.25]))
+        npt.assert_almost_equal(
+                [0.25], lookup_table.get_simplex([0.25, 0.75]))
+        npt.assert_almost_equal([0.5], lookup_table.get_simplex([0.5, 0.5]))
+        npt.assert_almost_equal(
+                [0.1875], lookup_table.get_lerp([0.75, 0.25]))
+
+    def test_populate_batched(self):
+
+        input_specifications = [
+                {'from': -1, 'to': 1, 'points': 4},
+                {'from': 0, 'to': 2, 'points': 3}]
+        reference = LookupTable(
+                input_specifications = input_specifications,
+                output_size = 2)
+        reference.populate(function = _swap)
+
+        # A batched function populates the same table
+        lookup_table = LookupTable(
+                input_specifications = input_specifications,
+                output_size = 2)
+        lookup_table.populate(function = _swap_many, batched = True,
+                chunk_size = 5)
+        npt.assert_almost_equal(reference._table, lookup_table._table)
+
+        # So does a pool of processes
+        lookup_table = LookupTable(
+                input_specifications = input_specifications,
+                output_size = 2)
+        lookup_table.populate(function = _swap, processes = 2)
+        npt.assert_almost_equal(reference._table, lookup_table._table)
+
+        # The worker processes are joined, also when the function fails
+        self.assertEqual([], multiprocessing.active_children())
+        self.assertRaises(ValueError, lookup_table.populate,
+                function = _fail, processes = 2)
+        self.assertEqual([], multiprocessing.active_children())
+
+    def test_populate_continuation(self):
+
+        lookup_table = LookupTable(
+                input_specifications = [
+                    {'from': 0, 'to': 2, 'points': 3},
+                    {'from': 0, 'to': 3, 'points': 4},
+                    {'from': 0, 'to': 1, 'points': 2}],
+                output_size = 3)
+        seeds = list()
+        def f(x, seed):
+            seeds.append(seed)
+            return x
+        input_indices = lookup_table.populate_continuation(function = f)
+
+        # All the points of the grid are populated
+        npt.assert_almost_equal(
+                lookup_table._from_indices(lookup_table._grid_indices()),
+                lookup_table._table.reshape(-1, 3))
+
+        # Each point is seeded with the output at an adjacent point
+        self.assertEqual(None, seeds[0])
+        for seed, indices in zip(seeds[1:], input_indices[1:]):
+            distance = np.sum(np.abs(seed - indices))
+            self.assertAlmostEqual(1, distance)
+
+    def test_save_load(self):
+
+        input_specifications = [
+                {'from': -1, 'to': 1, 'points': 4},
+                {'from': 0, 'to': 2, 'points': 3}]
+        lookup_table = LookupTable(
+                input_specifications = input_specifications,
+                output_size = 2)
+        lookup_table.populate(function = _swap)
+        directory = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(directory, 'lookup')
+            lookup_table.save(filename, fingerprint = 'swap')
+
+            # The saved lookup table can be memory-mapped
+            loaded_table = LookupTable(
+                    input_specifications = input_specifications,
+                    output_size = 2)
+            loaded_table.load(filename, mmap_mode = 'r', fingerprint = 'swap')
+            self.assertIsInstance(loaded_table._table, np.memmap)
+            npt.assert_almost_equal(lookup_table._table, loaded_table._table)
+
+            # The saved lookup table describes its own grid
+            loaded_table = LookupTable.open(filename + '.npy')
+            npt.assert_almost_equal(
+                    lookup_table.get_lerp([0.3, 1.2]),
+                    loaded_table.get_lerp([0.3, 1.2]))
+
+            # The grid and the fingerprint must match
+            with self.assertRaises(ValueError):
+                LookupTable(
+                        input_specifications = input_specifications[:1],
+                        output_size = 2).load(filename)
+            with self.assertRaises(ValueError):
+                loaded_table.load(filename, fingerprint = 'identity')
+        finally:
+            shutil.rmtree(directory)
+
+    def test_dtypes(self):
+
+        input_specifications = [
+                {'from': 0, 'to': 3, 'points': 31},
+                {'from': -1, 'to': 1, 'points': 21}]
+        f = lambda x: np.column_stack((np.sin(x[:, 0]), 100 * x[:, 1]))
+        input_vectors = np.random.RandomState(0).uniform(
+                (0, -1), (3, 1), (50, 2))
+        expected = LookupTable(
+                input_specifications = input_specifications,
+                output_size = 2)
+        expected.populate(function = f, batched = True)
+        expected = expected.get_lerp_many(input_vectors)
+
+        # Smaller storage, interpolated in float64
+        for dtype, decimal in ((np.float32, 5), (np.int16, 2)):
+            lookup_table = LookupTable(
+                    input_specifications = input_specifications,
+                    output_size = 2,
+                    dtype = dtype)
+            lookup_table.populate(function = f, batched = True)
+            self.assertEqual(dtype, lookup_table._table.dtype)
+            output_vectors = lookup_table.get_lerp_many(input_vectors)
+            self.assertEqual(np.float64, output_vectors.dtype)
+            self.assertEqual(np.float64,
+                    lookup_table.get_nearest_many(input_vectors).dtype)
+            npt.assert_almost_equal(expected, output_vectors,
+                    decimal = decimal)
+
+        # Integer output ranges are fitted to each output component
+        npt.assert_almost_equal([0.5, 0], lookup_table._offset, decimal = 3)
+        npt.assert_almost_equal([0.5, 100],
+                lookup_table._scale * np.iinfo(np.int16).max, decimal = 3)
+
+        # Compressed integer lookup table with its output ranges
+        directory = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(directory, 'lookup')
+            lookup_table.save(filename, compressed = True)
+            self.assertFalse(os.path.isfile(filename + '.npy'))
+            loaded_table = LookupTable.open(filename)
+            self.assertEqual(np.int16, loaded_table._table.dtype)
+            npt.assert_almost_equal(output_vectors,
+                    loaded_table.get_lerp_many(input_vectors))
+
+            # The dtype must match
+            with self.assertRaises(ValueError):
+                LookupTable(
+                        input_specifications = input_specifications,
+                        output_size = 2).load(filename)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_pinned_output_ranges(self):
+
+        # Output ranges set by the caller are not fitted when populating
+        input_specifications = [{'from': 0, 'to': 3, 'points': 31}]
+        f = lambda x: (np.sin(x[0]), 4 * x[0] - 6)
+        lookup_table = LookupTable(
+                input_specifications = input_specifications,
+                output_size = 2,
+                dtype = np.int16,
+                output_ranges = [(-10, 10), (-10, 10)])
+        for populate in (lookup_table.populate,
+                lambda f: lookup_table.populate_continuation(
+                    lambda x, seed: f(x))):
+            populate(f)
+            npt.assert_almost_equal([0, 0], lookup_table._offset)
+            npt.assert_almost_equal([10, 10],
+                    lookup_table._scale * np.iinfo(np.int16).max)
+            npt.assert_almost_equal(f((1.25,)),
+                    lookup_table.get_lerp((1.25,)), decimal = 2)
+
+        # They must match those of a saved lookup table, as must the dtype
+        directory = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(directory, 'lookup')
+            lookup_table.save(filename)
+            loaded_table = LookupTable.open(filename, dtype = np.int16,
+                    output_ranges = [(-10, 10), (-10, 10)])
+            npt.assert_almost_equal(lookup_table.get_lerp((1.25,)),
+                    loaded_table.get_lerp((1.25,)))
+            with self.assertRaises(ValueError):
+                LookupTable.open(filename,
+                        output_ranges = [(-10, 10), (-5, 5)])
+            with self.assertRaises(ValueError):
+                LookupTable.open(filename, dtype = np.int32)
+        finally:
+            shutil.rmtree(directory)
+
+def _swap(x):
+    return (x[1], x[0])
+
+def _swap_many(x):
+    return x[:, ::-1]
+
+def _fail(x):
+    raise ValueError('Failed')
+
+class AdaptiveLookupTableTestCase(unittest.TestCase):
+
+    def test_refine(self):
+
+        # Adaptive lookup table for a 2D function, nonlinear in its first
+        # component only
+        lookup_table = AdaptiveLookupTable(
+                input_specifications = [
+                    {'from': 0, 'to': 1, 'points': 3},
+                    {'from': -1, 'to': 1, 'points': 3}],
+                output_size = 2)
+        f = lambda x: (x[0] ** 4, x[1] * 2)
+        error = lookup_table.populate(function = f, max_error = 1e-3)
+        self.assertLessEqual(error, 1e-3)
+
+        # Only the first component is refined, mostly where the function
+        # curves the most
+        points = lookup_table._input_points
+        self.assertEqual(3, points[1])
+        self.assertLess(points[0], 33)
+        breakpoints = lookup_table._breakpoints[0]
+        self.assertLess(np.sum(breakpoints < 0.5), np.sum(breakpoints > 0.5))
+
+        # Interpolation at grid points and between them
+        npt.assert_almost_equal(f((0.5, 0.25)),
+                lookup_table.get_lerp((0.5, 0.25)))
+        input_vectors = np.random.RandomState(0).uniform(
+                (0, -1), (1, 1), (100, 2))
+        expected = [f(x) for x in input_vectors]
+        npt.assert_almost_equal(expected,
+                lookup_table.get_lerp_many(input_vectors), decimal = 2)
+        npt.assert_almost_equal(expected,
+                lookup_table.get_simplex_many(input_vectors), decimal = 2)
+
+    def test_max_points(self):
+
+        # Refinement stops before the grid exceeds the maximum number of
+        # points
+        lookup_table = AdaptiveLookupTable(
+                input_specifications = [{'from': 0, 'to': 1, 'points': 2}],
+                output_size = 1)
+        error = lookup_table.populate(
+                function = lambda x: np.sin(x * 20),
+                batched = True, max_error = 1e-6, max_points = 20)
+        self.assertGreater(error, 1e-6)
+        self.assertLessEqual(lookup_table._input_points[0], 20)
+
+    def test_int16(self):
+
+        # Refinement runs in float64 before the outputs are quantized
+        lookup_table = AdaptiveLookupTable(
+                input_specifications = [{'from': 0, 'to': 1, 'points': 5}],
+                output_size = 1,
+                dtype = np.int16)
+        f = lambda x: [np.sin(3 * x[0])]
+        error = lookup_table.populate(function = f, max_error = 1e-2)
+        self.assertLessEqual(error, 1e-2)
+        self.assertEqual(np.int16, lookup_table._table.dtype)
+        input_vectors = np.linspace(0, 1, 50).reshape(-1, 1)
+        npt.assert_almost_equal([f(x) for x in input_vectors],
+                lookup_table.get_lerp_many(input_vectors), decimal = 2)
+
+    def test_save_open(self):
+
+        # The breakpoints are saved with the lookup table
+        lookup_table = AdaptiveLookupTable(
+                input_specifications = [{'from': -1, 'to': 1, 'points': 3}],
+                output_size = 1)
+        lookup_table.populate(function = lambda x: x ** 2, max_error = 0.01)
+        directory = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(directory, 'table')
+            lookup_table.save(filename, fingerprint = 'square')
+            loaded = AdaptiveLookupTable.open(filename)
+            npt.assert_almost_equal(
+                    lookup_table._breakpoints[0], loaded._breakpoints[0])
+            npt.assert_almost_equal(
+                    lookup_table.get_lerp([0.3]), loaded.get_lerp([0.3]))
+            self.assertRaises(ValueError, loaded.load, filename,
+                    fingerprint = 'cube')
+        finally:
+            shutil.rmtree(directory)
+
+class LazyLookupTableTestCase(unittest.TestCase):
+
+    def test_lazy(self):
+
+        # Only the corners used by interpolation are calculated, once
+        calculated = list()
+        def f(x):
+            calculated.extend(map(tuple, x))
+            return x.sum(axis = 1)[:, np.newaxis]
+        lookup_table = LazyLookupTable(
+                input_specifications = [
+                    {'from': 0, 'to': 4, 'points': 5},
+                    {'from': 0, 'to': 4, 'points': 5}],
+                output_size = 1)
+        lookup_table.populate(function = f, batched = True)
+        self.assertEqual(0, lookup_table.valid_count())
+        npt.assert_almost_equal([3], lookup_table.get_lerp([1.5, 1.5]))
+        self.assertEqual(4, len(calculated))
+        npt.assert_almost_equal([2.5], lookup_table.get_lerp([1.25, 1.25]))
+        self.assertEqual(4, len(calculated))
+        npt.assert_almost_equal([[6], [1]],
+                lookup_table.get_nearest_many([[3, 3], [0, 1]]))
+        self.assertEqual(6, len(calculated))
+        self.assertEqual(6, lookup_table.valid_count())
+
+    def test_flush(self):
+
+        input_specifications = [
+                {'from': 0, 'to': 4, 'points': 5},
+                {'from': 0, 'to': 4, 'points': 5}]
+        calculated = list()
+        def f(x):
+            calculated.extend(map(tuple, x))
+            return x.sum(axis = 1)[:, np.newaxis]
+        directory = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(directory, 'table')
+
+            # Calculated points are flushed, then reused by later tables
+            lookup_table = LazyLookupTable(
+                    input_specifications = input_specifications,
+                    output_size = 1,
+                    filename = filename,
+                    fingerprint = 'sum',
+                    flush_points = 4)
+            lookup_table.populate(function = f, batched = True)
+            lookup_table.get_lerp([1.5, 1.5])
+            lookup_table.get_nearest([3, 3])
+            lookup_table = LazyLookupTable(
+                    input_specifications = input_specifications,
+                    output_size = 1,
+                    filename = filename,
+                    fingerprint = 'sum',
+                    flush_points = 4)
+            lookup_table.populate(function = f, batched = True)
+            self.assertEqual(4, lookup_table.valid_count())
+            lookup_table.get_lerp([1.5, 1.5])
+            self.assertEqual(5, len(calculated))
+
+            # Explicit flush of the remaining points
+            lookup_table.get_nearest([3, 3])
+            lookup_table.flush()
+            self.assertEqual(5, LazyLookupTable(
+                    input_specifications = input_specifications,
+                    output_size = 1,
+                    filename = filename,
+                    fingerprint = 'sum').valid_count())
+
+            # Points calculated for another function are not reused
+            self.assertEqual(0, LazyLookupTable(
+                    input_specifications = input_specifications,
+                    output_size = 1,
+                    filename = filename,
+                    fingerprint = 'product').valid_count())
+        finally:
+            shutil.rmtree(directory)
+
+    def test_output_ranges(self):
+
+        # Points of an integer lookup table are quantized as they are
+        # calculated, within output ranges set up front
+        lookup_table = LazyLookupTable(
+                input_specifications = [{'from': 0, 'to': 1, 'points': 5}],
+                output_size = 1,
+                dtype = np.int16,
+                output_ranges = [(0, 2)])
+        lookup_table.populate(function = lambda x: 2 * x ** 2)
+        npt.assert_almost_equal([0.3125], lookup_table.get_lerp([0.375]),
+                decimal = 4)
+        lookup_table = LazyLookupTable(
+                input_specifications = [{'from': 0, 'to': 1, 'points': 5}],
+                output_size = 1,
+                dtype = np.int16)
+        lookup_table.populate(function = lambda x: 2 * x ** 2)
+        self.assertRaises(ValueError, lookup_table.get_lerp, [0.5])
+
+    def test_no_function(self):
+
+        # Points cannot be calculated before populate sets the function
+        lookup_table = LazyLookupTable(
+                input_specifications = [{'from': 0, 'to': 1, 'points': 2}],
+                output_size = 1)
+        self.assertRaises(ValueError, lookup_table.get_lerp, [0.5])
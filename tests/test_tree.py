@@ -0,0 +1,245 @@
+import unittest
+import numpy as np
+import numpy.testing as npt
+
+import os
+import shutil
+import sys
+import tempfile
+import types
+
+# The drawing functions need VPython, which the kinematics do not
+try: import visual
+except ImportError: sys.modules['visual'] = types.ModuleType('visual')
+
+from robotics.kinematics.tree import *
+import robotics.kinematics.tree
+from robotics.kinematics.tree import _generated_modules
+from robotics.jacobian import *
+
+def _example_tree():
+    """Branched tree with chained joints, oblique axes, mount angles and
+    a root which is not the identity.
+    """
+    tree = Tree(Displacement(
+            translation = (0.5, -1, 2),
+            rotation = Rotation.axis_angle((1, 2, 3), 0.7)))
+    tree.add_node('a_joint', RevoluteJoint((0, 0, 1), 0.3))
+    tree.add_node('a', RigidLink(1), 'a_joint')
+    # Chained joints without a link in between
+    tree.add_node('b_joint', RevoluteJoint((1, 1, 0), -0.2), 'a')
+    tree.add_node('c_joint', RevoluteJoint((0, 1, 0), 0), 'b_joint')
+    tree.add_node('c', RigidLink(1.5), 'c_joint')
+    # First branch
+    tree.add_node('d1_joint', RevoluteJoint((1, -2, 0.5), 1.1), 'c')
+    tree.add_node('d1', RigidLink(0.8), 'd1_joint')
+    tree.add_node('e1', RigidLink(0.4), 'd1')
+    # Second branch, with a fixed link before its joint
+    tree.add_node('d2', RigidLink(0.6), 'c')
+    tree.add_node('e2_joint', RevoluteJoint((0, 0, 1), -0.5), 'd2')
+    tree.add_node('e2', RigidLink(1.2), 'e2_joint')
+    return tree
+
+_joints = ('a_joint', 'b_joint', 'c_joint', 'd1_joint', 'e2_joint')
+_endpoints = ['e1', 'e2', 'c']
+
+def _evaluate(tree, joints_angles):
+    """Displacements of the nodes of a tree evaluated by walking it"""
+    parameters = tree.prepare_parameters()
+    for key, angle in zip(_joints, joints_angles):
+        parameters[key]['angle'] = angle
+    return tree.evaluate(parameters)
+
+class CompiledTreeTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tree = _example_tree()
+        self.random = np.random.RandomState(0)
+
+    def assert_displacements(self, expected, compiled_tree):
+        for key, displacement in expected.items():
+            npt.assert_almost_equal(displacement.translation,
+                    compiled_tree.translation(key))
+            npt.assert_almost_equal(displacement.rotation._matrix,
+                    compiled_tree.rotation_matrix(key))
+
+    def test_evaluate(self):
+        for incremental in (False, True):
+            compiled_tree = self.tree.compile(
+                    joints = _joints, incremental = incremental)
+            joints_angles = np.zeros(len(_joints))
+            for _ in xrange(20):
+                # Change a single joint angle at a time
+                joints_angles = joints_angles.copy()
+                joints_angles[self.random.randint(len(_joints))] = \
+                        self.random.uniform(-3, 3)
+                compiled_tree.evaluate(joints_angles)
+                self.assert_displacements(
+                        _evaluate(self.tree, joints_angles), compiled_tree)
+
+    def test_displacement(self):
+        compiled_tree = self.tree.compile(joints = _joints)
+        joints_angles = self.random.uniform(-3, 3, len(_joints))
+        compiled_tree.evaluate(joints_angles)
+        expected = _evaluate(self.tree, joints_angles)['e2']
+        displacement = compiled_tree.displacement('e2')
+        npt.assert_almost_equal(expected.translation,
+                displacement.translation)
+        npt.assert_almost_equal(expected.rotation._matrix,
+                displacement.rotation._matrix)
+        out = Displacement()
+        compiled_tree.displacement_into('e2', out)
+        npt.assert_almost_equal(expected.translation, out.translation)
+        npt.assert_almost_equal(expected.rotation._matrix,
+                out.rotation._matrix)
+
+    def test_evaluate_many(self):
+        compiled_tree = self.tree.compile(joints = _joints)
+        joints_angles = self.random.uniform(-3, 3, (7, len(_joints)))
+        rotations, translations = compiled_tree.evaluate_many(joints_angles)
+        for n, x in enumerate(joints_angles):
+            for key, displacement in _evaluate(self.tree, x).items():
+                i = compiled_tree.index(key)
+                npt.assert_almost_equal(
+                        displacement.translation, translations[n, i])
+                npt.assert_almost_equal(
+                        displacement.rotation._matrix, rotations[n, i])
+
+    def test_jacobian(self):
+        compiled_tree = self.tree.compile(joints = _joints)
+        endpoints = lambda x: np.concatenate([_evaluate(self.tree, x)[key]
+            .translation for key in _endpoints])
+        solver = JacobianSolver(function = endpoints, input_delta = 1e-6)
+        jacobian = compiled_tree.jacobian_function(_endpoints)
+        joints_angles = self.random.uniform(-3, 3, (5, len(_joints)))
+        matrices = compiled_tree.jacobian_many(joints_angles, _endpoints)
+        for x, matrix in zip(joints_angles, matrices):
+            expected = solver._jacobian_matrix(input_vector = x)
+            npt.assert_almost_equal(expected, jacobian(x), decimal = 4)
+            npt.assert_almost_equal(jacobian(x), matrix)
+
+    def test_incremental(self):
+        compiled_tree = self.tree.compile(
+                joints = _joints, incremental = True)
+        joints_angles = self.random.uniform(-3, 3, len(_joints))
+        compiled_tree.evaluate(joints_angles)
+
+        # Only the subtree of the modified joint is evaluated again
+        marker = np.array((99., 99., 99.))
+        compiled_tree.translation('e1')[:] = marker
+        joints_angles[_joints.index('e2_joint')] += 0.1
+        compiled_tree.evaluate(joints_angles)
+        npt.assert_equal(marker, compiled_tree.translation('e1'))
+        self.assert_displacements(
+                {'e2': _evaluate(self.tree, joints_angles)['e2']},
+                compiled_tree)
+
+    def test_dependency_mask(self):
+        compiled_tree = self.tree.compile(joints = _joints)
+        endpoints = ['e1', 'e2']
+        mask = compiled_tree.dependency_mask(endpoints)
+        npt.assert_equal(np.repeat(((1, 1, 1, 1, 0), (1, 1, 1, 0, 1)),
+                3, axis = 0), mask)
+
+        # The joints of the two branches are probed together by finite
+        # differences, with one function call fewer
+        calls = list()
+        def f(x):
+            calls.append(x)
+            return np.concatenate([_evaluate(self.tree, x)[key]
+                .translation for key in endpoints])
+        x = self.random.uniform(-3, 3, len(_joints))
+        expected = JacobianSolver(function = f,
+                input_delta = 1e-6)._jacobian_matrix(input_vector = x)
+        self.assertEqual(1 + len(_joints), len(calls))
+        del calls[:]
+        matrix = JacobianSolver(function = f, input_delta = 1e-6,
+                dependency_mask = mask)._jacobian_matrix(input_vector = x)
+        self.assertEqual(len(_joints), len(calls))
+        npt.assert_almost_equal(expected, matrix)
+        npt.assert_equal(0, matrix[~mask])
+
+    def test_folding(self):
+        compiled_tree = self.tree.compile(joints = _joints)
+
+        # Each node is anchored to its nearest upstream joint, the root
+        # and the links in between being folded into fixed displacements
+        anchors = {'root': None, 'a_joint': None, 'a': 'a_joint',
+                'b_joint': 'a_joint', 'c_joint': 'b_joint', 'c': 'c_joint',
+                'd1_joint': 'c_joint', 'd1': 'd1_joint', 'e1': 'd1_joint',
+                'd2': 'c_joint', 'e2_joint': 'c_joint', 'e2': 'e2_joint'}
+        for key, anchor in anchors.items():
+            index = compiled_tree._anchors[compiled_tree.index(key)]
+            if anchor is None: self.assertLess(index, 0)
+            else: self.assertEqual(compiled_tree.index(anchor), index)
+
+    def test_generate(self):
+        compiled_tree = self.tree.compile(joints = _joints)
+        endpoints, jacobian = compiled_tree.generate(
+                _endpoints, jacobian = True)
+        for x in self.random.uniform(-3, 3, (5, len(_joints))):
+            displacements = _evaluate(self.tree, x)
+            npt.assert_almost_equal(np.concatenate([displacements[key]
+                .translation for key in _endpoints]), endpoints(x))
+            compiled_tree.evaluate(x)
+            npt.assert_almost_equal(
+                    compiled_tree.jacobian(_endpoints), jacobian(x))
+
+        # Without the Jacobian, a single function is returned
+        endpoint = compiled_tree.generate(['e1'])
+        x = self.random.uniform(-3, 3, len(_joints))
+        npt.assert_almost_equal(
+                _evaluate(self.tree, x)['e1'].translation, endpoint(x))
+
+    def test_generate_cache(self):
+        compiled_tree = self.tree.compile(joints = _joints)
+        directory = tempfile.mkdtemp()
+        try:
+            cache_directory = os.path.join(directory, 'generated')
+            endpoints = compiled_tree.generate(
+                    _endpoints, cache_directory = cache_directory)
+            filenames = os.listdir(cache_directory)
+            self.assertEqual(1, len(filenames))
+            filename = os.path.join(cache_directory, filenames[0])
+
+            # A later startup compiles the cached source file instead of
+            # generating it, as shown by tampering with it
+            with open(filename) as source_file:
+                source = source_file.read()
+            with open(filename, 'w') as source_file:
+                source_file.write(source.replace(
+                    'return np.array', 'return 2 * np.array'))
+            _generated_modules.clear()
+            cached_endpoints = compiled_tree.generate(
+                    _endpoints, cache_directory = cache_directory)
+            self.assertEqual(filename,
+                    cached_endpoints.func_code.co_filename)
+            x = self.random.uniform(-3, 3, len(_joints))
+            npt.assert_almost_equal(2 * endpoints(x), cached_endpoints(x))
+
+            # The module is then cached in memory
+            self.assertIs(cached_endpoints, compiled_tree.generate(
+                    _endpoints, cache_directory = cache_directory))
+
+            # The cache key depends on the geometry of the tree
+            other_tree = _example_tree()
+            other_tree.add_node('f', RigidLink(1), 'e2')
+            other_tree.compile(joints = _joints).generate(
+                    _endpoints, cache_directory = cache_directory)
+            self.assertEqual(2, len(os.listdir(cache_directory)))
+
+            # So does the version of the generator
+            module = robotics.kinematics.tree
+            fingerprint = module.generator_fingerprint
+            module.generator_fingerprint = lambda: 'other'
+            try:
+                compiled_tree.generate(
+                        _endpoints, cache_directory = cache_directory)
+            finally: module.generator_fingerprint = fingerprint
+            self.assertEqual(3, len(os.listdir(cache_directory)))
+
+            # No temporary file remains
+            self.assertTrue(all(filename.endswith('.py')
+                for filename in os.listdir(cache_directory)))
+        finally:
+            shutil.rmtree(directory)